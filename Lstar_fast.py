@@ -1,8 +1,45 @@
-import socket
+import contextlib
 import random
-import time
+
+from alphabet_mapper import AlphabetMapper
+from counterexamples import all_prefixes, all_suffixes, rivest_schapire, shorten_counterexample
+from eq_oracles import ConformanceOracle, cache_counterexample
+from ftp_client import FTPClient
+from ftp_server2 import FTPSession
+from kv_learner import KVLearner
+from metrics import Reporter, metrics
+from minimize import minimize_mealy
+from model_fuzzer import ModelFuzzer
+from observation_table import ObservationTable
+from query_store import QueryStore, fetch_banner
+from query_trie import CompactQueryTrie, maximal_words
+from sut_farm import FarmDispatcher, SUTFarm, probe
+from teacher import ConcurrentTeacher, InProcessTeacher
 
 ALPHABET = ["USER", "PASS", "LIST", "QUIT"]
+TARGET_IP = "127.0.0.1"
+TARGET_PORT = 2121
+READ_TIMEOUT = 0.5 # Ceiling for reply waits; the client adapts below it from observed RTT
+PIPELINE = True # Send each query's commands in one write; falls back to lock-step if the target can't take it
+RESET_WORD = [("REIN", "220")] # Commands (and the reply each must get) that reset a pooled session; None reconnects
+ENGINE = "lstar" # "lstar" (observation table) or "kv" (discrimination tree)
+EQ_METHOD = "random" # "random", or conformance testing with "w" / "wp"
+EXTRA_STATES = 1 # Wp/W suites find targets with up to this many states beyond the hypothesis
+EQ_BUDGET = None # Max live tests per conformance EQ (None: whole suite)
+CE_STRATEGY = "suffixes" # "suffixes", "prefixes" or "rs" (Rivest-Schapire)
+SINK_OUTPUTS = ("221", "421", "OFF") # Replies after which the session is over: every extension is answered OFF locally
+ABSTRACT_INPUTS = False # Learn over input classes of ALPHABET, split only when a counterexample tells members apart
+TEACHER = "socket" # "socket", "farm" (FARM_SIZE servers from TARGET_PORT up), or "inprocess" to drive ftp_server2.FTPSession directly
+FARM_SERVER = "ftp_server2" # "ftp_server2" or "lstarimpy"; ports that already answer are attached to instead
+FARM_SIZE = 4 # Target instances in "farm" mode, one process and working directory each
+WORKERS = 8 # Parallel sessions; bounds load on the server instead of a fixed sleep
+QUERY_DB = "ftp_queries.db" # Answers persisted across runs, keyed by target
+METRICS_LOG = "ftp_metrics.jsonl" # Periodic JSON snapshots of query counts, latencies and phase times
+METRICS_PROM = "ftp_metrics.prom" # Prometheus text-format snapshot, rewritten each interval
+METRICS_INTERVAL = 10.0 # Seconds between metric reports
+MODEL_JSON = "ftp_learned_model.json" # Learned model for offline comparison: python model_diff.py old.json new.json
+FUZZ_SECONDS = 0 # After learning, fuzz the target this long from every state of the model (0: off)
+FUZZ_FINDINGS = "ftp_fuzz_findings.jsonl" # Model deviations, dropped sessions and crashes, one JSON object per line
 
 class MealyMachine:
     def __init__(self):
@@ -36,230 +73,220 @@ class MealyMachine:
                 outputs.append("OFF") # Default for dead paths
         return outputs
 
+client = FTPClient(TARGET_IP, TARGET_PORT, READ_TIMEOUT, pipeline=PIPELINE, reset_word=RESET_WORD, pool_size=WORKERS)
+
+@metrics.instrument_query
 def membership_query(sequence):
-    # Small sleep to prevent OS socket exhaustion
-    time.sleep(0.01)
-    try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(0.5)
-        sock.connect(("127.0.0.1", 2121))
-        sock.recv(1024) 
-        
-        outputs = []
-        alive = True
-        for cmd in sequence:
-            if not alive:
-                outputs.append("OFF")
-                continue
-            try:
-                sock.sendall((cmd + "\r\n").encode())
-                data = sock.recv(1024)
-                if not data:
-                    alive = False
-                    outputs.append("OFF")
-                else:
-                    # Capture only the 3-digit status code
-                    outputs.append(data.decode().strip()[:3])
-            except:
-                alive = False
-                outputs.append("OFF")
-        sock.close()
-        return outputs
-    except:
-        return ["OFF"] * len(sequence)
+    return client.membership_query(sequence)
 
 class LStarMealy:
-    def __init__(self, alphabet):
-        self.alphabet = alphabet
-        self.S = [()]
-        self.E = [()] # Start blind to force Equivalence Query
-        self.mq_cache = {}
+    def __init__(self, alphabet, store=None, teacher=None, ce_strategy=CE_STRATEGY, eq_oracle=None):
+        # The core works on symbols 0..k-1; command strings only exist at the
+        # teacher, the store and in exported models (see decode/decode_machine)
+        self.names = list(alphabet)
+        self.codes = {a: i for i, a in enumerate(self.names)}
+        self.alphabet = list(range(len(self.names)))
+        self.table = ObservationTable(self.alphabet, self.table_entry) # E starts blind to force Equivalence Query
+        self.S, self.E = self.table.S, self.table.E
+        self.mq_cache = CompactQueryTrie(len(self.alphabet), SINK_OUTPUTS)
+        self.store = store
+        self.ce_strategy = ce_strategy
+        self.eq_oracle = eq_oracle
+        if eq_oracle is not None:
+            eq_oracle.alphabet = self.alphabet # It tests hypotheses over the interned symbols
+        self.access = {}
+        self.teacher = teacher if teacher is not None else ConcurrentTeacher(membership_query, WORKERS)
+        if store is not None:
+            print(f"Loaded {store.load(self.mq_cache, self.encode)} stored queries")
+
+    def encode(self, word):
+        """Command strings to symbols, or None if `word` uses one outside the alphabet."""
+        try:
+            return tuple(self.codes[a] for a in word)
+        except KeyError:
+            return None
+
+    def decode(self, word):
+        return tuple(self.names[a] for a in word)
 
-        
+    def decode_machine(self, hyp):
+        machine = MealyMachine()
+        for state, trans in hyp.transitions.items():
+            for a, (next_state, output) in trans.items():
+                machine.add_transition(state, self.names[a], next_state, output)
+        machine.initial_state = hyp.initial_state
+        return machine
 
 
     def table_entry(self, s, e):
+        metrics.inc("table_entries")
         full = s + e
         if not full:
             return "INIT"
 
-        if full not in self.mq_cache:
-            self.mq_cache[full] = membership_query(full)
+        return self.query(full)[-1]
 
-        return self.mq_cache[full][-1]
+    def query(self, sequence):
+        # Every prefix of an answered query is answered too, so only go live on a trie miss
+        outputs = self.mq_cache.lookup(sequence)
+        if outputs is None:
+            metrics.inc("cache_misses")
+            outputs = self.teacher.query(self.decode(sequence))
+            self.record(sequence, outputs)
+        else:
+            metrics.inc("cache_hits")
+        return outputs
+
+    def record(self, sequence, outputs):
+        self.mq_cache.insert(sequence, outputs)
+        if self.store is not None: self.store.add(self.decode(sequence), outputs)
+
+    def prefetch(self, sequences):
+        # Hand every uncached word to the teacher at once so they run in parallel.
+        # Hits and misses are counted once, by query() when the answer is read.
+        words = [seq for seq in dict.fromkeys(sequences) if seq]
+        missing = [seq for seq in words if self.mq_cache.peek(seq) is None]
+        for seq, outputs in zip(missing, self.teacher.query_batch([self.decode(seq) for seq in missing])):
+            self.record(seq, outputs)
+        return len(missing)
 
 
+    @metrics.phase("fill_table")
+    def fill_table(self):
+        # Only rows that are new or missing a new suffix's column need answers;
+        # send them in one burst, minus words that prefix another cell
+        words = self.table.missing_words()
+        sent = self.prefetch(maximal_words(words))
+        if sent:
+            print(f"Filled table: {len(words)} new cells, {sent} queries")
+        self.table.update()
+
     def row(self, s):
-        return tuple(self.table_entry(s, e) for e in self.E)
+        return self.table.row(s)
 
     def is_closed(self):
-        S_rows = {self.row(s) for s in self.S}
-        for s in self.S:
-            for a in self.alphabet:
-                sa = s + (a,)
-                if self.row(sa) not in S_rows: return False, sa
-        return True, None
+        witness = self.table.find_unclosed()
+        return witness is None, witness
 
     def is_consistent(self):
-        for s1 in self.S:
-            for s2 in self.S:
-                if s1 != s2 and self.row(s1) == self.row(s2):
-                    for a in self.alphabet:
-                        if self.row(s1 + (a,)) != self.row(s2 + (a,)):
-                            return False, (s1, s2, a)
-        return True, None
+        witness = self.table.find_inconsistent()
+        return witness is None, witness
 
     def build_hypothesis(self):
         hyp = MealyMachine()
-        
-        # 1. Map each UNIQUE row to a state ID
-        unique_rows = {}
-        for s in self.S:
-            r = self.row(s)
-            if r not in unique_rows:
-                unique_rows[r] = len(unique_rows)
-                
-        # 2. Use one representative 's' for each unique row to build transitions
-        # We only need to iterate over S, but only process a row once.
-        processed_rows = set()
-        for s in self.S:
-            r = self.row(s)
-            if r in processed_rows:
-                continue
-            
-            curr_state_id = unique_rows[r]
-            
+        # One state per distinct row in S; E[0] is the empty suffix, so column 0
+        # of row(s·a) is the output of the transition (s, a)
+        state_of = {r: i for i, r in enumerate(self.table.index)}
+        self.access = {}
+        for r, members in self.table.index.items():
+            s = members[0]
+            self.access[state_of[r]] = s
             for a in self.alphabet:
-                # Output is determined by the transition (s, a)
-                out = self.table_entry(s, (a,))
-                
-                # Next state is determined by the row of the concatenated sequence (s + a)
                 next_row = self.row(s + (a,))
-                next_state_id = unique_rows[next_row]
-                
-                hyp.add_transition(curr_state_id, a, next_state_id, out)
-                
-            processed_rows.add(r)
-            
-        # Set the initial state (row of the empty sequence)
-        hyp.initial_state = unique_rows[self.row(())]
-
-        # Group prefixes by their row profiles
-        profiles = {}
-        for s in self.S:
-            r = self.row(s)
-            if r not in profiles: profiles[r] = []
-            profiles[r].append(s)
-
-        
-        
+                hyp.add_transition(state_of[r], a, state_of[next_row], next_row[0])
+        hyp.initial_state = state_of[self.row(())]
         return hyp
 
+    @metrics.phase("equivalence")
     def equivalence_query(self, hyp):
+        metrics.inc("eq_rounds")
         print(f"EQ: Testing {len(hyp.transitions)} states...")
-        for _ in range(150): # Increased test count
-            test = tuple(random.choice(self.alphabet) for _ in range(random.randint(1, 8)))
-            if membership_query(test) != hyp.simulate(test):
-                print(f"!!! Counterexample: {test}")
-                return test
+        # Answers we already paid for are free counterexamples
+        ce = cache_counterexample(hyp, self.mq_cache)
+        if ce:
+            print(f"!!! Counterexample from cache: {self.decode(ce)}")
+            return ce
+        if self.eq_oracle is not None:
+            ce = self.eq_oracle.find_counterexample(hyp, self.query, self.prefetch, self.mq_cache, self.teacher.workers)
+            if ce: print(f"!!! Counterexample: {self.decode(ce)}")
+            return ce
+        tests = [tuple(random.choice(self.alphabet) for _ in range(random.randint(1, 8))) for _ in range(150)] # Increased test count
+        # Run the tests one pool-width at a time so we can still stop at the first counterexample
+        for i in range(0, len(tests), self.teacher.workers):
+            chunk = tests[i:i + self.teacher.workers]
+            self.prefetch(chunk)
+            for test in chunk:
+                if self.query(test) != hyp.simulate(test):
+                    print(f"!!! Counterexample: {self.decode(test)}")
+                    return test
         return None
 
+    @metrics.phase("counterexample")
+    def process_counterexample(self, ce, hyp):
+        if self.ce_strategy == "prefixes":
+            for prefix in all_prefixes(ce): self.table.add_prefix(prefix)
+            return
+        if self.ce_strategy == "rs":
+            # One suffix per counterexample instead of all of them; each costs |S ∪ S·Σ| queries
+            short = shorten_counterexample(ce, hyp, self.query, self.mq_cache)
+            suffix = rivest_schapire(short, hyp, self.access, self.query)
+            if suffix is not None and self.table.add_suffix(suffix):
+                print(f"Counterexample of length {len(ce)} shortened to {len(short)}, adding suffix {self.decode(suffix)} to E.")
+                return
+        for suffix in all_suffixes(ce): self.table.add_suffix(suffix)
+
     def run(self):
         while True:
             while True:
+                self.fill_table()
                 closed, witness = self.is_closed()
                 if not closed:
-                    print(f"State {witness} is not closed.")
-                    self.S.append(witness); continue
+                    print(f"State {self.decode(witness)} is not closed.")
+                    self.table.add_prefix(witness); continue
                 consistent, witness = self.is_consistent()
                 if not consistent:
                     s1, s2, a = witness
-                    r1, r2 = self.row(s1+(a,)), self.row(s2+(a,))
-                    for i, e in enumerate(self.E):
-                        if r1[i] != r2[i]:
-                            print(f"Rows {s1} and {s2} are inconsistent on input {a}. Adding suffix {(a,) + e} to E.")
-                            self.E.append((a,) + e); break
+                    e = self.table.distinguishing_suffix(s1 + (a,), s2 + (a,))
+                    print(f"Rows {self.decode(s1)} and {self.decode(s2)} are inconsistent on input {self.names[a]}. Adding suffix {self.decode((a,) + e)} to E.")
+                    self.table.add_suffix((a,) + e)
                     continue
                 break
 
             hyp = self.build_hypothesis()
             ce = self.equivalence_query(hyp)
             if not ce: return hyp
-            for i in range(len(ce)):
-                suffix = ce[i:]
-                if suffix not in self.E: self.E.append(suffix)
-def minimize_mealy(machine, alphabet):
-        states = list(machine.transitions.keys())
-    
-        # Initial partition: group states by output behavior
-        partitions = []
-        output_map = {}
-    
-        for s in states:
-          signature = tuple(machine.transitions[s][a][1] for a in alphabet)
-          if signature not in output_map:
-            output_map[signature] = []
-          output_map[signature].append(s)
-    
-        partitions = list(output_map.values())
-    
-        changed = True
-        while changed:
-          changed = False
-          new_partitions = []
-    
-          for group in partitions:
-            subgroup_map = {}
-    
-            for state in group:
-                signature = []
-                for a in alphabet:
-                    next_state = machine.transitions[state][a][0]
-                    
-                    # Find which partition next_state belongs to
-                    for idx, part in enumerate(partitions):
-                        if next_state in part:
-                            signature.append(idx)
-                            break
-                
-                signature = tuple(signature)
-                
-                if signature not in subgroup_map:
-                    subgroup_map[signature] = []
-                subgroup_map[signature].append(state)
-            
-            if len(subgroup_map) > 1:
-                changed = True
-            
-            new_partitions.extend(subgroup_map.values())
-        
-          partitions = new_partitions
-    
-        # Build minimized machine
-        minimized = MealyMachine()
-        state_map = {}
-    
-        for idx, group in enumerate(partitions):
-           for state in group:
-             state_map[state] = idx
-    
-        for idx, group in enumerate(partitions):
-           representative = group[0]
-           for a in alphabet:
-            next_state, output = machine.transitions[representative][a]
-            minimized.add_transition(
-                idx,
-                a,
-                state_map[next_state],
-                output
-            )
-    
-        return minimized
+            self.process_counterexample(ce, hyp)
+
+
+def learn(alphabet, store=None, teacher=None):
+    """One learning run over `alphabet`; returns the learner and its model over command strings."""
+    oracle = ConformanceOracle(alphabet, EQ_METHOD, EXTRA_STATES, EQ_BUDGET) if EQ_METHOD != "random" else None
+    learner = LStarMealy(alphabet, store, teacher, eq_oracle=oracle)
+    if ENGINE == "kv":
+        # The L* object still provides the cache, store, teacher and EQ oracle
+        model = KVLearner(learner.alphabet, learner.query, learner.equivalence_query, MealyMachine, learner.prefetch, learner.mq_cache).run()
+    else:
+        model = learner.run()
+    return learner, learner.decode_machine(model)
 
 
 if __name__ == "__main__":
-    learner = LStarMealy(ALPHABET)
-    model = learner.run()
+    # NumPy is only needed to save the model, not to import learn() (e.g. from learner_bench)
+    from compact_mealy import CompactMealy
+    reporter = Reporter(metrics, METRICS_LOG, METRICS_PROM, METRICS_INTERVAL)
+    # In-process runs measure the learner alone, so they skip the network and the on-disk store
+    teacher = InProcessTeacher(FTPSession()) if TEACHER == "inprocess" else None
+    farm = None
+    if TEACHER == "farm":
+        farm = SUTFarm(FARM_SERVER, TARGET_IP, TARGET_PORT, FARM_SIZE).start()
+        dispatcher = FarmDispatcher(farm, READ_TIMEOUT, pipeline=PIPELINE, reset_word=RESET_WORD, pool_size=WORKERS)
+        teacher = ConcurrentTeacher(metrics.instrument_query(dispatcher.membership_query), WORKERS * len(farm.instances))
+    if TEACHER != "inprocess":
+        stored = QueryStore(QUERY_DB, TARGET_IP, TARGET_PORT, fetch_banner(TARGET_IP, TARGET_PORT))
+    else:
+        stored = contextlib.nullcontext()
+    with stored as store, metrics.phase("learn"):
+        if ABSTRACT_INPUTS:
+            # Each abstract run sees only the class representatives; the mapper answers it
+            # from its own cache over all of ALPHABET and asks the real teacher for the rest
+            mapper = AlphabetMapper(ALPHABET, teacher or ConcurrentTeacher(membership_query, WORKERS), store, SINK_OUTPUTS)
+            model = mapper.learn(lambda reps: learn(reps, mapper, mapper)[1], MealyMachine)
+            cache = mapper.cache
+            print(f"Input classes: {mapper.classes}")
+        else:
+            learner, model = learn(ALPHABET, store, teacher)
+            cache = learner.mq_cache
+    print(f"Query cache: {cache.stats()}")
 
     print("\n--- BEFORE MINIMIZATION ---")
     for state, trans in model.transitions.items():
@@ -267,10 +294,22 @@ if __name__ == "__main__":
 
     model.export_dot("model_before.dot")
 
-    min_model = minimize_mealy(model, ALPHABET)
+    with metrics.phase("minimize"):
+        min_model = minimize_mealy(model, ALPHABET)
 
     print("\n--- AFTER MINIMIZATION ---")
     for state, trans in min_model.transitions.items():
        print(f"State {state}: {trans}")
 
     min_model.export_dot("ftp_learned_model.dot")
+    CompactMealy.from_machine(min_model, ALPHABET).save(MODEL_JSON)
+
+    if FUZZ_SECONDS:
+        # Farm instances are health-checked by the dispatcher, so only a single target is probed for crashes
+        alive = (lambda: probe(TARGET_IP, TARGET_PORT)) if TEACHER == "socket" else None
+        fuzzer = ModelFuzzer(min_model, ALPHABET, teacher or ConcurrentTeacher(membership_query, WORKERS), alive, findings_path=FUZZ_FINDINGS)
+        fuzzer.run(FUZZ_SECONDS)
+    if farm is not None:
+        dispatcher.close()
+        farm.stop()
+    reporter.close()
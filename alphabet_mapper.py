@@ -0,0 +1,218 @@
+import random
+
+from eq_oracles import access_sequences, characterizing_set, state_identifiers
+from metrics import metrics
+from query_trie import QueryTrie, maximal_words
+
+
+class AlphabetMapper:
+    """Learns over input classes of a large command set instead of every command.
+
+    Commands start in one class, represented by its first member, and the
+    learner only ever sees the representatives. After each abstract run the
+    classes are checked against the model: in every state, each member and
+    its representative are followed by the model's characterizing words, and
+    members that answer differently are split off. Then the model, lifted to
+    every command, is tested with random words. A counterexample that the
+    representatives alone don't reproduce is narrowed down to one command c
+    and a context (u, v) where u·c·v and u·rep(c)·v answer differently, and
+    c's class is split on that context. The learner is rerun after a split.
+
+    The mapper is also the teacher and store of each abstract run: answers
+    live in one trie over concrete commands, so a rerun replays everything
+    from it and only new words reach `teacher` (and `store`, if given).
+    Each random test is an access sequence of the model followed by up to
+    `max_length` commands.
+    """
+
+    def __init__(self, commands, teacher, store=None, sinks=(), tests=150, max_length=8):
+        self.commands = list(commands)
+        self.teacher = teacher
+        self.workers = teacher.workers
+        self.store = store
+        self.cache = QueryTrie(sinks)
+        if store is not None:
+            print(f"Loaded {store.load(self.cache)} stored queries")
+        self.tests = tests
+        self.max_length = max_length
+        self.classes = [self.commands]
+        self.rep_of = dict.fromkeys(self.commands, self.commands[0])
+
+    def representatives(self):
+        return [members[0] for members in self.classes]
+
+    def abstract(self, word):
+        return tuple(self.rep_of[c] for c in word)
+
+    # Teacher interface, for the abstract runs
+
+    def query(self, word):
+        outputs = self.cache.lookup(word)
+        if outputs is None:
+            outputs = self.teacher.query(word)
+            self.record(word, outputs)
+        return outputs
+
+    membership_query = query
+
+    def query_batch(self, words):
+        self.prefetch(words)
+        return [self.cache.peek(w) for w in words]
+
+    def prefetch(self, words):
+        missing = [w for w in maximal_words(w for w in words if w) if self.cache.peek(w) is None]
+        for word, outputs in zip(missing, self.teacher.query_batch(missing)):
+            self.record(word, outputs)
+        return len(missing)
+
+    def record(self, word, outputs):
+        self.cache.insert(word, outputs)
+        if self.store is not None: self.store.add(word, outputs)
+
+    def close(self):
+        self.teacher.close()
+
+    # Store interface, for the abstract runs
+
+    def load(self, trie, encode):
+        """Replay every cached word into `trie`, cut at the first command `encode` doesn't know."""
+        count = 0
+        stack = [(self.cache.root, (), ())]
+        while stack:
+            node, word, outputs = stack.pop()
+            deeper = False
+            for symbol, child, output in self.cache.edges(node):
+                if encode((symbol,)) is not None:
+                    stack.append((child, word + (symbol,), outputs + (output,)))
+                    deeper = True
+            if word and not deeper:
+                trie.insert(encode(word), list(outputs))
+                count += 1
+        return count
+
+    def add(self, word, outputs):
+        pass # Already recorded when the teacher answered
+
+    # Refinement
+
+    def lift(self, hyp, machine_cls):
+        """`hyp` (over the representatives) with every command behaving like its representative."""
+        machine = machine_cls()
+        for state, trans in hyp.transitions.items():
+            for c in self.commands:
+                next_state, output = trans[self.rep_of[c]]
+                machine.add_transition(state, c, next_state, output)
+        machine.initial_state = hyp.initial_state
+        return machine
+
+    def split(self, prefix, suffix, command=None):
+        """Split classes (or just `command`'s) by each member's answers to prefix·c·suffix."""
+        classes = [m for m in self.classes if len(m) > 1 and (command is None or command in m)]
+        self.prefetch([prefix + (c,) + suffix for members in classes for c in members])
+        added = 0
+        for members in classes:
+            groups = {}
+            for c in members:
+                groups.setdefault(tuple(self.query(prefix + (c,) + suffix)[len(prefix):]), []).append(c)
+            if len(groups) == 1:
+                continue
+            # The representative's group keeps its place, so its symbol stays the same
+            first, *rest = groups.values()
+            self.classes[self.classes.index(members)] = first
+            self.classes.extend(rest)
+            for group in rest:
+                for c in group:
+                    self.rep_of[c] = group[0]
+            added += len(rest)
+        if added:
+            metrics.inc("class_splits", added)
+        return added
+
+    def split_by_states(self, hyp, access):
+        """Split off commands that behave unlike their representative in some state of `hyp`.
+
+        In each state, every member must give its representative's reply and
+        then agree on the identifiers (Wp) of the state the representative
+        leads to. That is a few short queries per state and command instead
+        of a conformance suite over every command.
+        """
+        states = list(access)
+        W = characterizing_set(hyp, self.representatives(), states)
+        ids = {q: state_identifiers(hyp, q, states, W) for q in states}
+        checks, words = [], []
+        for q, u in access.items():
+            for members in self.classes:
+                if len(members) > 1:
+                    for w in [()] + ids[hyp.transitions[q][members[0]][0]]:
+                        checks.append((u, w, members[0]))
+                        words.extend(u + (c,) + w for c in members)
+        self.prefetch(words)
+        return sum(self.split(u, w, rep) for u, w, rep in checks)
+
+    def find_counterexample(self, lifted, access):
+        starts = list(access.values())
+        tests = [random.choice(starts) + tuple(random.choice(self.commands) for _ in range(random.randint(1, self.max_length)))
+                 for _ in range(self.tests)]
+        for i in range(0, len(tests), self.workers):
+            chunk = tests[i:i + self.workers]
+            self.prefetch(chunk)
+            for test in chunk:
+                if self.query(test) != lifted.simulate(test):
+                    return test
+        return None
+
+    def analyse(self, ce, hyp):
+        """Split a class on `ce` if a command in it is to blame; False if `ce` is a plain counterexample to `hyp`.
+
+        With x_j the word whose first j commands are replaced by their
+        representatives, x_0 = ce disagrees with the model and x_n, over
+        representatives only, agrees unless the abstract model is wrong.
+        A binary search finds adjacent x_j, x_j+1 that disagree with each
+        other, which differ only in the command at j.
+        """
+        expected = hyp.simulate(self.abstract(ce))
+        if self.query(self.abstract(ce)) != expected:
+            return False
+
+        def mixed(j):
+            return self.abstract(ce[:j]) + ce[j:]
+
+        lo, hi = 0, len(ce)
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if self.query(mixed(mid)) != expected:
+                lo = mid
+            else:
+                hi = mid
+        print(f"Input {ce[lo]} behaves unlike {self.rep_of[ce[lo]]} after {self.abstract(ce[:lo])}, splitting its class")
+        if not self.split(self.abstract(ce[:lo]), ce[lo + 1:], ce[lo]):
+            raise RuntimeError(f"Input {ce[lo]} no longer behaves unlike {self.rep_of[ce[lo]]} on {ce} (nondeterministic target?)")
+        return True
+
+    def learn(self, run, machine_cls):
+        """Run `run(alphabet)` over the representatives until the lifted model survives testing.
+
+        `run` returns a model over the alphabet it was given, in command
+        strings. Returns that model lifted to every command. Every rerun
+        must add a class or a state; if neither grows, the target answers
+        inconsistently and this raises RuntimeError instead of looping.
+        """
+        last = None
+        while True:
+            print(f"Learning over {len(self.classes)} input classes of {len(self.commands)} commands")
+            hyp = run(self.representatives())
+            size = (len(self.classes), len(hyp.transitions))
+            if last is not None and size <= last:
+                raise RuntimeError(f"Rerun made no progress ({size[0]} classes, {size[1]} states; nondeterministic target?)")
+            last = size
+            with metrics.phase("refine_inputs"):
+                access = access_sequences(hyp, self.representatives())
+                if self.split_by_states(hyp, access):
+                    continue
+                lifted = self.lift(hyp, machine_cls)
+                ce = self.find_counterexample(lifted, access)
+                if ce is None:
+                    return lifted
+                # An abstract counterexample is in the cache now, so the rerun finds it there
+                if not self.analyse(ce, hyp):
+                    print(f"Counterexample over representatives: {self.abstract(ce)}")
@@ -0,0 +1,129 @@
+import gzip
+import json
+
+import numpy as np
+
+
+class CompactMealy:
+    """MealyMachine stored as integer NumPy tables.
+
+    Inputs and outputs are interned to ints; `next_state[q, a]` and
+    `output[q, a]` replace the dict-of-dicts. The last input column is
+    reserved for symbols outside the alphabet and, like a missing
+    transition in `MealyMachine.simulate`, outputs "OFF" and stays put.
+    """
+
+    def __init__(self, inputs, outputs, next_state, output, initial_state=0, states=None):
+        self.inputs = list(inputs)
+        self.input_index = {a: i for i, a in enumerate(self.inputs)}
+        self.outputs = list(outputs)
+        self.output_index = {o: i for i, o in enumerate(self.outputs)}
+        self.next_state = np.asarray(next_state, dtype=np.int32)
+        self.output = np.asarray(output, dtype=np.int32)
+        self.initial_state = initial_state
+        # Original state names, by row
+        self.states = states if states is not None else list(range(len(self.next_state)))
+
+    @classmethod
+    def from_machine(cls, machine, alphabet=None):
+        if alphabet is None:
+            alphabet = list(dict.fromkeys(a for trans in machine.transitions.values() for a in trans))
+        states = [machine.initial_state] + list(machine.transitions)
+        for trans in machine.transitions.values():
+            states.extend(next_state for next_state, _ in trans.values())
+        states = list(dict.fromkeys(states))
+        num = {s: i for i, s in enumerate(states)}
+        outputs = ["OFF"]
+        output_index = {"OFF": 0}
+        n, k = len(states), len(alphabet)
+        next_state = np.tile(np.arange(n, dtype=np.int32)[:, None], (1, k + 1))
+        output = np.zeros((n, k + 1), dtype=np.int32)
+        for s, trans in machine.transitions.items():
+            for j, a in enumerate(alphabet):
+                if a not in trans:
+                    continue
+                target, out = trans[a]
+                if out not in output_index:
+                    output_index[out] = len(outputs)
+                    outputs.append(out)
+                next_state[num[s], j] = num[target]
+                output[num[s], j] = output_index[out]
+        return cls(alphabet, outputs, next_state, output, 0, states)
+
+    def to_machine(self, machine_cls):
+        machine = machine_cls()
+        for q in range(len(self.next_state)):
+            for j, a in enumerate(self.inputs):
+                target, out = int(self.next_state[q, j]), self.outputs[self.output[q, j]]
+                if target == q and out == "OFF":
+                    continue # Implicit in the dict form
+                machine.add_transition(q, a, target, out)
+        machine.initial_state = self.initial_state
+        return machine
+
+    def save(self, path):
+        """Write the tables as JSON (gzipped if `path` ends in .gz), for diffing models offline.
+
+        Both tables are stored row-major as flat int lists without the
+        reserved column, so a model costs about two numbers per transition.
+        """
+        k = len(self.inputs)
+        data = {
+            "inputs": self.inputs,
+            "outputs": self.outputs,
+            "initial_state": int(self.initial_state),
+            "states": self.states,
+            "next_state": self.next_state[:, :k].ravel().tolist(),
+            "output": self.output[:, :k].ravel().tolist(),
+        }
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "wt") as f:
+            json.dump(data, f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt") as f:
+            data = json.load(f)
+        outputs = data["outputs"]
+        if "OFF" not in outputs:
+            outputs.append("OFF")
+        n, k = len(data["states"]), len(data["inputs"])
+        next_state = np.empty((n, k + 1), dtype=np.int32)
+        output = np.empty((n, k + 1), dtype=np.int32)
+        next_state[:, :k] = np.asarray(data["next_state"], dtype=np.int32).reshape(n, k)
+        output[:, :k] = np.asarray(data["output"], dtype=np.int32).reshape(n, k)
+        next_state[:, k] = np.arange(n)
+        output[:, k] = outputs.index("OFF")
+        return cls(data["inputs"], outputs, next_state, output, data["initial_state"], data["states"])
+
+    def encode(self, words):
+        """Pack words into a (len(words), max_len) int array, padded with -1."""
+        get, unknown = self.input_index.get, len(self.inputs)
+        lengths = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+        codes = np.full((len(words), int(lengths.max(initial=0))), -1, dtype=np.int32)
+        flat = np.fromiter((get(a, unknown) for w in words for a in w), dtype=np.int32, count=int(lengths.sum()))
+        # Scatter the flat symbol stream into rows: column = position within its word
+        rows = np.repeat(np.arange(len(words)), lengths)
+        starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        codes[rows, np.arange(len(flat)) - starts] = flat
+        return codes
+
+    def simulate_codes(self, codes):
+        """Run every row of `codes` at once; returns output codes, -1 where padded."""
+        state = np.full(len(codes), self.initial_state, dtype=np.int32)
+        out = np.full(codes.shape, -1, dtype=np.int32)
+        for t in range(codes.shape[1]):
+            col = codes[:, t]
+            active = col >= 0
+            sym = np.where(active, col, 0)
+            out[:, t] = np.where(active, self.output[state, sym], -1)
+            state = np.where(active, self.next_state[state, sym], state)
+        return out
+
+    def simulate_batch(self, words):
+        out = self.simulate_codes(self.encode(words))
+        return [[self.outputs[o] for o in row[:len(w)]] for row, w in zip(out.tolist(), words)]
+
+    def simulate(self, input_sequence):
+        return self.simulate_batch([input_sequence])[0]
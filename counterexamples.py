@@ -0,0 +1,75 @@
+def state_after(hyp, word):
+    state = hyp.initial_state
+    for symbol in word:
+        # A missing transition is an "OFF" self-loop, as in MealyMachine.simulate
+        state = hyp.transitions.get(state, {}).get(symbol, (state,))[0]
+    return state
+
+
+def all_suffixes(ce):
+    return [ce[i:] for i in range(len(ce))]
+
+
+def all_prefixes(ce):
+    return [ce[:i] for i in range(1, len(ce) + 1)]
+
+
+def shorten_counterexample(ce, hyp, query, cache):
+    """Cut `ce` down using the hypothesis and answers we already have.
+
+    The live outputs of `ce` are cached, so truncating after the first
+    mismatching output is free. Then any loop in the hypothesis run
+    (u·w·v with u and u·w reaching the same state) is dropped when the
+    cache already shows u·v is still a counterexample.
+    """
+    ce = _truncate(ce, query(ce), hyp)
+    shortened = True
+    while shortened:
+        shortened = False
+        seen = {}
+        state = hyp.initial_state
+        for i in range(len(ce) + 1):
+            j = seen.get(state)
+            if j is not None:
+                candidate = ce[:j] + ce[i:]
+                known = cache.peek(candidate)
+                if known is not None and known != hyp.simulate(candidate):
+                    ce = _truncate(candidate, known, hyp)
+                    shortened = True
+                    break
+            seen[state] = i
+            if i < len(ce):
+                state = hyp.transitions[state][ce[i]][0]
+    return ce
+
+
+def _truncate(ce, outputs, hyp):
+    for i, (o, h) in enumerate(zip(outputs, hyp.simulate(ce))):
+        if o != h:
+            return ce[:i + 1]
+    return ce
+
+
+def rivest_schapire(ce, hyp, access, query):
+    """Binary-search `ce` for one suffix that separates two hypothesis states.
+
+    `ce` must end at its first mismatching output and `access` maps each
+    hypothesis state to its prefix in S. Returns None if the answers are
+    not consistent with the table (e.g. a flaky target).
+    """
+    expected = hyp.simulate(ce)[-1]
+
+    def agrees(i):
+        # Replace ce[:i] by the access sequence of the state the hypothesis reaches with it
+        return query(access[state_after(hyp, ce[:i])] + ce[i:])[-1] == expected
+
+    lo, hi = 0, len(ce) - 1
+    if lo >= hi or agrees(lo) or not agrees(hi):
+        return None
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if agrees(mid):
+            hi = mid
+        else:
+            lo = mid
+    return ce[hi:]
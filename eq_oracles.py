@@ -0,0 +1,161 @@
+from itertools import product
+
+from counterexamples import state_after
+from query_trie import maximal_words
+
+
+def access_sequences(hyp, alphabet):
+    """Shortest input word reaching each state (BFS from the initial state)."""
+    access = {hyp.initial_state: ()}
+    queue = [hyp.initial_state]
+    for state in queue:
+        for a in alphabet:
+            if a not in hyp.transitions.get(state, {}):
+                continue
+            next_state = hyp.transitions[state][a][0]
+            if next_state not in access:
+                access[next_state] = access[state] + (a,)
+                queue.append(next_state)
+    return access
+
+
+def _run_from(hyp, state, word):
+    outputs = []
+    for symbol in word:
+        trans = hyp.transitions.get(state, {})
+        if symbol in trans:
+            state, output = trans[symbol]
+        else:
+            output = "OFF"
+        outputs.append(output)
+    return tuple(outputs)
+
+
+def characterizing_set(hyp, alphabet, states):
+    """A set W of words whose outputs tell every pair of `states` apart."""
+    W = [(a,) for a in alphabet]
+    while True:
+        classes = {}
+        for q in states:
+            classes.setdefault(tuple(_run_from(hyp, q, w) for w in W), []).append(q)
+        added = False
+        for members in classes.values():
+            if len(members) < 2:
+                continue
+            rep = members[0]
+            for q in members[1:]:
+                word = _separate(hyp, alphabet, rep, q, W)
+                if word is not None and word not in W:
+                    W.append(word)
+                    added = True
+                    break
+        if not added:
+            return W
+
+
+def _separate(hyp, alphabet, p, q, W):
+    # p and q agree on W; if their a-successors don't, a·w separates them
+    for a in alphabet:
+        p2 = hyp.transitions.get(p, {}).get(a, (p,))[0]
+        q2 = hyp.transitions.get(q, {}).get(a, (q,))[0]
+        for w in W:
+            if _run_from(hyp, p2, w) != _run_from(hyp, q2, w):
+                return (a,) + w
+    return None
+
+
+def state_identifiers(hyp, state, states, W):
+    # Wp: the part of W needed to tell `state` apart from every other state
+    own = {w: _run_from(hyp, state, w) for w in W}
+    ids = []
+    for other in states:
+        if other == state:
+            continue
+        if any(_run_from(hyp, other, w) != own[w] for w in ids):
+            continue
+        for w in W:
+            if _run_from(hyp, other, w) != own[w]:
+                ids.append(w)
+                break
+    return ids or W[:1]
+
+
+def cache_counterexample(hyp, cache):
+    """Shortest cached word whose recorded outputs the hypothesis gets wrong.
+
+    Walks the query trie breadth-first, carrying the hypothesis state along,
+    so every cached prefix is checked once and no query is sent.
+    """
+    level = [(cache.root, hyp.initial_state, None)]
+    while level:
+        next_level = []
+        for node, state, path in level:
+            trans = hyp.transitions.get(state, {})
+            for symbol, child, recorded in cache.edges(node):
+                next_state, output = trans.get(symbol, (state, "OFF"))
+                if output != recorded:
+                    word = [symbol]
+                    while path is not None:
+                        symbol, path = path
+                        word.append(symbol)
+                    return tuple(reversed(word))
+                next_level.append((child, next_state, (symbol, path)))
+        level = next_level
+    return None
+
+
+class ConformanceOracle:
+    """W-method / Wp-method equivalence oracle over a hypothesis MealyMachine.
+
+    The suite is complete for targets with at most `extra_states` more states
+    than the hypothesis. Tests already answered by the cache are checked for
+    free, the rest are deduplicated, stripped of words that prefix another
+    test and sorted so shared prefixes sit together. At most `budget` live
+    tests are sent per call, and the first counterexample ends the search.
+    """
+
+    def __init__(self, alphabet, method="wp", extra_states=1, budget=None):
+        self.alphabet = alphabet
+        self.method = method
+        self.extra_states = extra_states
+        self.budget = budget
+
+    def test_suite(self, hyp):
+        access = access_sequences(hyp, self.alphabet)
+        states = list(access)
+        W = characterizing_set(hyp, self.alphabet, states)
+        middles = [m for k in range(self.extra_states + 1) for m in product(self.alphabet, repeat=k)]
+        state_cover = list(access.values())
+        transition_cover = [p + (a,) for p in state_cover for a in self.alphabet]
+        if self.method == "w":
+            return [p + m + w for p in state_cover + transition_cover for m in middles for w in W]
+        tests = [p + m + w for p in state_cover for m in middles for w in W]
+        ids = {}
+        covered = set(state_cover)
+        for p in transition_cover:
+            if p in covered:
+                continue
+            for m in middles:
+                state = state_after(hyp, p + m)
+                if state not in ids:
+                    ids[state] = state_identifiers(hyp, state, states, W)
+                tests.extend(p + m + w for w in ids[state])
+        return tests
+
+    def find_counterexample(self, hyp, query, prefetch, cache, batch=8):
+        live = []
+        for test in maximal_words(self.test_suite(hyp)):
+            known = cache.peek(test)
+            if known is None:
+                live.append(test)
+            elif known != hyp.simulate(test):
+                return test
+        if self.budget is not None:
+            live = live[:self.budget]
+        for i in range(0, len(live), batch):
+            chunk = live[i:i + batch]
+            prefetch(chunk)
+            for test in chunk:
+                if query(test) != hyp.simulate(test):
+                    return test
+        return None
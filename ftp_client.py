@@ -0,0 +1,293 @@
+import socket
+import threading
+import time
+from collections import deque
+
+from metrics import metrics
+
+CLOSING_CODES = ("221", "421") # Replies after which the server closes the control connection
+
+
+class TargetUnreachable(Exception):
+    """No session could be opened after every retry; the query has no answer."""
+
+
+def read_reply(stream):
+    """Read one complete FTP reply from a binary file-like socket stream.
+
+    A multi-line reply opens with "xyz-" and runs until a line starting with
+    the same code and a space (RFC 959 §4.2). Returns the 3-digit code, or
+    None if the server closed the connection first.
+    """
+    line = stream.readline()
+    if not line:
+        return None
+    text = line.decode(errors="ignore")
+    code = text[:3]
+    if text[3:4] == "-":
+        end = code + " "
+        while True:
+            line = stream.readline()
+            if not line:
+                return None
+            if line.decode(errors="ignore").startswith(end):
+                break
+    return code
+
+
+class LatencyTracker:
+    """Rolling window of reply round-trip times for one target.
+
+    The read timeout is `factor` times the observed high percentile,
+    clamped to [floor, ceiling]. Until `warmup` samples are in, the
+    ceiling (the old fixed timeout) is used.
+    """
+
+    def __init__(self, ceiling, floor=0.02, factor=4.0, percentile=0.99, window=512, warmup=32):
+        self.ceiling = ceiling
+        self.floor = floor
+        self.factor = factor
+        self.percentile = percentile
+        self.warmup = warmup
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
+        self.current = ceiling
+        self.pending = 0
+
+    def add(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+            self.pending += 1
+            # Re-sorting the window on every sample would cost more than the reads
+            if len(self.samples) >= self.warmup and self.pending >= 16:
+                self.pending = 0
+                ordered = sorted(self.samples)
+                high = ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))]
+                self.current = min(self.ceiling, max(self.floor, high * self.factor))
+
+    def timeout(self):
+        return self.current
+
+
+class Backoff:
+    """Shared delay before new connections, grown only by connection failures.
+
+    Each failed connect (refused, reset, timed out or turned away before
+    a 2xx greeting) doubles it up to `maximum`; each success halves it, so a healthy
+    target is never throttled. Failures within one delay period count
+    once, so a pool of workers hitting the same outage doesn't compound it.
+    """
+
+    def __init__(self, base=0.05, maximum=5.0):
+        self.base = base
+        self.maximum = maximum
+        self.delay = 0.0
+        self.raised = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        delay = self.delay
+        if delay:
+            time.sleep(delay)
+
+    def failure(self):
+        with self.lock:
+            now = time.monotonic()
+            if now - self.raised < self.delay:
+                return
+            self.raised = now
+            self.delay = min(self.maximum, max(self.base, self.delay * 2))
+
+    def success(self):
+        with self.lock:
+            self.delay = self.delay / 2 if self.delay > self.base else 0.0
+
+
+class FTPClient:
+    """Socket teacher for one FTP target with adaptive timeouts and pacing.
+
+    membership_query(sequence) opens a session, sends each command and
+    records the reply code, or "OFF" from the first command the server
+    closes on or leaves unanswered. A connect only succeeds on a 2xx
+    greeting (not e.g. "421 Too many connections"). Failed connects are
+    retried `retries` times behind the shared backoff; after that the
+    query raises TargetUnreachable instead of being answered with OFF.
+
+    With `pipeline`, the whole word goes out in one send and the replies
+    are matched to commands in order, so a query costs about one RTT
+    instead of one per command. The first `probes` multi-command queries
+    are also run lock-step; any disagreement, or a pipelined read that
+    stalls, turns pipelining off for good. Once trusted, a pipelined read
+    that times out or is reset is ambiguous (which command went
+    unanswered?), so that query is redone lock-step.
+
+    With a `reset_word` (pairs of command and the reply code it must get,
+    e.g. [("REIN", "220")]), finished sessions go back to a pool of up to
+    `pool_size` idle connections and are reset instead of reconnected.
+    A reset that gets the wrong code disables pooling, one that gets no
+    answer just costs a fresh connection.
+    """
+
+    def __init__(self, host, port, read_timeout, connect_timeout=3.0, retries=3, pipeline=True, probes=16,
+                 reset_word=None, pool_size=8):
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.latency = LatencyTracker(read_timeout)
+        self.backoff = Backoff()
+        self.pipeline = None if pipeline else False # None while still probing
+        self.probes = probes
+        self.lock = threading.Lock()
+        self.reset_word = reset_word
+        self.pool_size = pool_size
+        self.idle = []
+
+    def connect(self):
+        for _ in range(self.retries + 1):
+            self.backoff.wait()
+            sock = stream = None
+            try:
+                # Dropped SYNs under parallel load are retried after 1s, so don't let connect give up earlier
+                sock = socket.create_connection((self.host, self.port), self.connect_timeout)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                sock.settimeout(self.latency.ceiling)
+                stream = sock.makefile("rb")
+                code = read_reply(stream)
+                if code is None:
+                    raise ConnectionResetError("closed before greeting")
+                if not code.startswith("2"):
+                    raise ConnectionRefusedError(f"greeting {code}")
+            except OSError:
+                # The socket's fd stays open until its stream is closed too
+                if stream is not None:
+                    stream.close()
+                if sock is not None:
+                    sock.close()
+                metrics.inc("connect_errors")
+                self.backoff.failure()
+                continue
+            self.backoff.success()
+            metrics.inc("connections")
+            return sock, stream
+        metrics.inc("connect_failures")
+        raise TargetUnreachable(f"{self.host}:{self.port} refused {self.retries + 1} connection attempts")
+
+    def acquire(self):
+        while self.reset_word:
+            with self.lock:
+                if not self.idle:
+                    break
+                sock, stream = self.idle.pop()
+            if self.reset(sock, stream):
+                metrics.inc("session_reuses")
+                return sock, stream
+            stream.close()
+            sock.close()
+        return self.connect()
+
+    def reset(self, sock, stream):
+        try:
+            sock.settimeout(self.latency.timeout())
+            for cmd, expected in self.reset_word:
+                sock.sendall((cmd + "\r\n").encode())
+                code = read_reply(stream)
+                if code != expected:
+                    if code is not None:
+                        self.disable_pool(f"{cmd} got {code}, expected {expected}")
+                    return False
+        except OSError:
+            return False
+        return True
+
+    def disable_pool(self, reason):
+        with self.lock:
+            if self.reset_word is None:
+                return
+            print(f"Session reset failed ({reason}), reconnecting for every query")
+            metrics.inc("reset_failures")
+            self.reset_word = None
+            idle, self.idle = self.idle, []
+        for sock, stream in idle:
+            stream.close()
+            sock.close()
+
+    def release(self, sock, stream, outputs, sequence):
+        # Only a session that answered everything and wasn't told to close can be reset
+        if self.reset_word and len(outputs) == len(sequence) and not any(o in CLOSING_CODES for o in outputs):
+            with self.lock:
+                if self.reset_word and len(self.idle) < self.pool_size:
+                    self.idle.append((sock, stream))
+                    return
+        stream.close()
+        sock.close()
+
+    def membership_query(self, sequence):
+        if self.pipeline is False or len(sequence) < 2:
+            return self.lockstep(sequence)
+        outputs = self.pipelined(sequence)
+        if outputs is not None and self.pipeline:
+            return outputs
+        expected = self.lockstep(sequence)
+        if self.pipeline:
+            metrics.inc("pipeline_retries")
+            return expected
+        with self.lock:
+            if outputs != expected and self.pipeline is None:
+                print(f"Target mishandles pipelined commands ({sequence}: {outputs} vs {expected}), using lock-step")
+                metrics.inc("pipeline_fallbacks")
+                self.pipeline = False
+            elif self.pipeline is None:
+                self.probes -= 1
+                if self.probes <= 0:
+                    self.pipeline = True
+        return expected
+
+    def pipelined(self, sequence):
+        sock, stream = self.acquire()
+        outputs = []
+        try:
+            sock.settimeout(self.latency.timeout())
+            start = time.perf_counter()
+            sock.sendall("".join(cmd + "\r\n" for cmd in sequence).encode())
+            for _ in sequence:
+                code = read_reply(stream)
+                if code is None:
+                    # A clean close: every later command would have found the session gone
+                    break
+                if not outputs:
+                    # Later replies were already in flight, so only the first is a round trip
+                    self.latency.add(time.perf_counter() - start)
+                outputs.append(code)
+        except OSError:
+            stream.close()
+            sock.close()
+            return None
+        self.release(sock, stream, outputs, sequence)
+        return outputs + ["OFF"] * (len(sequence) - len(outputs))
+
+    def lockstep(self, sequence):
+        sock, stream = self.acquire()
+        outputs = []
+        try:
+            for cmd in sequence:
+                sock.settimeout(self.latency.timeout())
+                start = time.perf_counter()
+                try:
+                    sock.sendall((cmd + "\r\n").encode())
+                    code = read_reply(stream)
+                except socket.timeout:
+                    metrics.inc("timeouts")
+                    break
+                except OSError:
+                    # Usually a command sent after the server hung up (e.g. after QUIT):
+                    # the session is over, but the target is healthy, so no backoff
+                    metrics.inc("connection_resets")
+                    break
+                if code is None:
+                    break
+                self.latency.add(time.perf_counter() - start)
+                outputs.append(code)
+        finally:
+            self.release(sock, stream, outputs, sequence)
+        return outputs + ["OFF"] * (len(sequence) - len(outputs))
@@ -1,70 +1,112 @@
-import socket
-import threading
+import asyncio
+import multiprocessing
+import sys
 
 HOST, PORT = "127.0.0.1", 2121
+BACKLOG = 4096 # Parallel learners open hundreds of short sessions per second
+WORKERS = 1 # More than one runs that many processes sharing PORT via SO_REUSEPORT
 
-def handle_session(conn, addr):
-    state = "CONNECTED"
-    user_count = 0 
+class FTPSession:
+    """Protocol state of one control connection, with no socket attached.
+
+    `handle` takes one command line and returns the reply line, or None
+    when the server ignores it; `closed` is set once the session ends.
+    `reset` returns to the freshly-connected state so one object can serve
+    any number of sessions.
+    """
+    __slots__ = ("state", "user_count", "closed")
+    BANNER = "220 Service Ready"
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.state = "CONNECTED"
+        self.user_count = 0
+        self.closed = False
+
+    def handle(self, line):
+        msg = line.strip().split()
+        if not msg: return None
+        command = msg[0].upper()
+
+        # Global QUIT command
+        if command == "QUIT":
+            self.closed = True
+            return "221 Goodbye"
+
+        # REIN (RFC 959): flush the login as if freshly connected
+        if command == "REIN":
+            self.reset()
+            return self.BANNER
+
+        # State Machine Logic
+        if self.state == "CONNECTED":
+            if command == "USER":
+                self.user_count += 1
+                if self.user_count < 2:
+                    return "331 More info needed"
+                self.state = "WAIT_PASS"
+                return "331 Password required"
+            return "530 Please login with USER"
+
+        if self.state == "WAIT_PASS":
+            if command == "PASS":
+                self.state = "AUTH"
+                return "230 Logged in"
+            return "503 Need PASS now"
+
+        if command == "LIST":
+            return "226 Listing done"
+        return "502 Not implemented"
+
+async def handle_session(reader, writer):
+    session = FTPSession()
 
     try:
         # Initial Banner
-        conn.sendall(b"220 Service Ready\r\n")
+        writer.write((session.BANNER + "\r\n").encode())
+        await writer.drain()
         
-        while True:
-            data = conn.recv(1024)
+        while not session.closed:
+            # readline reassembles commands split across TCP segments and
+            # separates several commands that arrive in one
+            data = await reader.readline()
             if not data: break
             
             try:
-                msg = data.decode().strip().split()
-                if not msg: continue
-                command = msg[0].upper()
+                reply = session.handle(data.decode())
             except: continue
+            if reply is None: continue
 
-            # Global QUIT command
-            if command == "QUIT":
-                conn.sendall(b"221 Goodbye\r\n")
-                break
-
-            # State Machine Logic
-            if state == "CONNECTED":
-                if command == "USER":
-                    user_count += 1
-                    if user_count < 2:
-                        conn.sendall(b"331 More info needed\r\n")
-                    else:
-                        conn.sendall(b"331 Password required\r\n")
-                        state = "WAIT_PASS"
-                else:
-                    conn.sendall(b"530 Please login with USER\r\n")
-
-            elif state == "WAIT_PASS":
-                if command == "PASS":
-                    conn.sendall(b"230 Logged in\r\n")
-                    state = "AUTH"
-                else:
-                    conn.sendall(b"503 Need PASS now\r\n")
-
-            elif state == "AUTH":
-                if command == "LIST":
-                    conn.sendall(b"226 Listing done\r\n")
-                else:
-                    conn.sendall(b"502 Not implemented\r\n")
+            writer.write((reply + "\r\n").encode())
+            await writer.drain()
                     
     except Exception:
         pass
     finally:
-        conn.close()
-
-def start_server():
-    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    server.bind((HOST, PORT))
-    server.listen(5)
-    print(f"FTP Server running on {PORT}...")
-    while True:
-        conn, addr = server.accept()
-        threading.Thread(target=handle_session, args=(conn, addr), daemon=True).start()
+        writer.close()
+
+async def serve(reuse_port=False, port=PORT):
+    server = await asyncio.start_server(handle_session, HOST, port, backlog=BACKLOG, reuse_port=reuse_port)
+    async with server:
+        await server.serve_forever()
+
+def run_worker(reuse_port, port=PORT):
+    try:
+        asyncio.run(serve(reuse_port, port))
+    except KeyboardInterrupt:
+        pass
+
+def start_server(workers=WORKERS, port=PORT):
+    print(f"FTP Server running on {port} ({workers} worker{'s' if workers > 1 else ''})...")
+    if workers <= 1:
+        run_worker(False, port)
+        return
+    procs = [multiprocessing.Process(target=run_worker, args=(True, port), daemon=True) for _ in range(workers)]
+    for p in procs: p.start()
+    for p in procs: p.join()
 
 if __name__ == "__main__":
-    start_server()
\ No newline at end of file
+    # Optional port argument, so a target farm can run one instance per port
+    start_server(port=int(sys.argv[1]) if len(sys.argv) > 1 else PORT)
\ No newline at end of file
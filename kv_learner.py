@@ -0,0 +1,122 @@
+from counterexamples import rivest_schapire, shorten_counterexample, state_after
+
+
+class _Node:
+    __slots__ = ("suffix", "children", "state")
+
+    def __init__(self, state=None):
+        self.suffix = None  # Discriminator on inner nodes, None on leaves
+        self.children = {}
+        self.state = state
+
+
+class KVLearner:
+    """Kearns–Vazirani learner over a discrimination tree.
+
+    Leaves are hypothesis states (each with an access sequence) and inner
+    nodes hold one discriminating suffix, branching on its outputs. A state
+    costs one query per discriminator on its path instead of a whole table
+    row, and each counterexample adds exactly one state and one suffix, found
+    with Rivest–Schapire and kept as short as the counterexample allows.
+
+    Takes the same callables the LStarMealy classes expose: a cache-first
+    `query`, `equivalence_query(hyp)`, and optionally `prefetch(words)` for
+    batching and the query `cache` for counterexample shortening.
+    """
+
+    def __init__(self, alphabet, query, equivalence_query, machine_cls, prefetch=None, cache=None):
+        self.alphabet = alphabet
+        self.query = query
+        self.equivalence_query = equivalence_query
+        self.machine_cls = machine_cls
+        self.prefetch = prefetch or (lambda words: None)
+        self.cache = cache
+        self.access = [()]
+        self.root = _Node(0)
+        self.leaf = [self.root]
+        self.targets = {}
+
+    def _outcome(self, word, suffix):
+        return tuple(self.query(word + suffix)[len(word):])
+
+    def _sift(self, pending):
+        # Sift all pending (state, symbol) transitions down the tree together so
+        # each level's queries go to the teacher as one batch
+        while pending:
+            self.prefetch([w + node.suffix for _, w, node in pending if node.suffix is not None])
+            still = []
+            for key, w, node in pending:
+                if node.suffix is None:
+                    self.targets[key] = node
+                    continue
+                outcome = self._outcome(w, node.suffix)
+                child = node.children.get(outcome)
+                if child is None:
+                    # An outcome no state has shown yet: w reaches a new state
+                    child = node.children[outcome] = _Node(len(self.access))
+                    self.access.append(w)
+                    self.leaf.append(child)
+                still.append((key, w, child))
+            pending = still
+
+    def _close(self):
+        states = range(len(self.access))
+        while True:
+            pending = [((q, a), self.access[q] + (a,), self.targets.get((q, a), self.root))
+                       for q in states for a in self.alphabet
+                       if (q, a) not in self.targets or self.targets[(q, a)].suffix is not None]
+            if not pending:
+                return
+            self._sift(pending)
+            states = range(len(self.access))
+
+    def build_hypothesis(self):
+        self._close()
+        self.prefetch([self.access[q] + (a,) for q in range(len(self.access)) for a in self.alphabet])
+        hyp = self.machine_cls()
+        for q, u in enumerate(self.access):
+            for a in self.alphabet:
+                hyp.add_transition(q, a, self.targets[(q, a)].state, self.query(u + (a,))[-1])
+        hyp.initial_state = 0
+        return hyp
+
+    def _split(self, hyp, ce):
+        if self.cache is not None:
+            ce = shorten_counterexample(ce, hyp, self.query, self.cache)
+        suffix = rivest_schapire(ce, hyp, self.access, self.query)
+        if suffix is not None and self._split_at(hyp, ce, len(ce) - len(suffix) - 1):
+            return True
+        # Rivest-Schapire found no split, so try every decomposition of the counterexample
+        return any(self._split_at(hyp, ce, lo) for lo in range(len(ce)))
+
+    def _split_at(self, hyp, ce, lo):
+        # ce[:lo] · a · suffix: access(q_lo)·a reaches a state the tree merged with q_hi
+        suffix = ce[lo + 1:]
+        if not suffix:
+            return False
+        q_lo = state_after(hyp, ce[:lo])
+        new_access = self.access[q_lo] + (ce[lo],)
+        old = self.targets[(q_lo, ce[lo])].state
+        old_outcome = self._outcome(self.access[old], suffix)
+        new_outcome = self._outcome(new_access, suffix)
+        if old_outcome == new_outcome:
+            return False
+        node = self.leaf[old]
+        node.suffix = suffix
+        node.state = None
+        old_leaf, new_leaf = _Node(old), _Node(len(self.access))
+        node.children = {old_outcome: old_leaf, new_outcome: new_leaf}
+        self.access.append(new_access)
+        self.leaf[old] = old_leaf
+        self.leaf.append(new_leaf)
+        return True
+
+    def run(self):
+        while True:
+            hyp = self.build_hypothesis()
+            ce = self.equivalence_query(hyp)
+            if not ce:
+                return hyp
+            if not self._split(hyp, ce):
+                # Returning hyp would pass off a model known to be wrong as the learned one
+                raise RuntimeError(f"Counterexample {ce} is not reproducible at {len(self.access)} states (nondeterministic target?)")
@@ -0,0 +1,153 @@
+import argparse
+import contextlib
+import io
+import json
+import random
+import time
+import tracemalloc
+
+import Lstar_fast
+import lstar2_siri
+from eq_oracles import ConformanceOracle
+from kv_learner import KVLearner
+from minimize import minimize_mealy
+from model_diff import distinguishing_word
+from teacher import MachineTeacher
+
+LEARNERS = {"Lstar_fast": Lstar_fast, "lstar2_siri": lstar2_siri}
+CE_STRATEGIES = ["suffixes", "prefixes", "rs"]
+EQ_METHODS = ["random", "wp"]
+
+
+def random_machine(machine_cls, states, inputs, outputs, sinks=0, seed=0):
+    """Random Mealy machine with every state reachable from state 0.
+
+    The last `sinks` states are absorbing and answer "OFF" to everything,
+    like a session the server has closed.
+    """
+    rng = random.Random(seed)
+    alphabet = [f"i{j}" for j in range(inputs)]
+    symbols = [f"o{j}" for j in range(outputs)]
+    live = states - sinks
+    machine = machine_cls()
+    # A random spanning tree over the live states keeps them all reachable
+    tree = {}
+    free = [(0, a) for a in alphabet]
+    for q in range(1, live):
+        tree[free.pop(rng.randrange(len(free)))] = q
+        free.extend((q, a) for a in alphabet)
+    for q in range(live):
+        for a in alphabet:
+            target = tree.get((q, a), rng.randrange(states))
+            machine.add_transition(q, a, target, rng.choice(symbols))
+    for q in range(live, states):
+        for a in alphabet:
+            machine.add_transition(q, a, q, "OFF")
+    machine.initial_state = 0
+    return machine, alphabet
+
+
+def chain_machine(machine_cls, states, inputs, outputs, sinks=0, seed=0):
+    """A login-style chain: one secret input per state advances, the rest reset.
+
+    Deep states are only reached by one specific word, which is what makes
+    random equivalence testing miss them. With `sinks`, the last input
+    closes the session from any state.
+    """
+    rng = random.Random(seed)
+    alphabet = [f"i{j}" for j in range(inputs)]
+    symbols = [f"o{j}" for j in range(outputs)]
+    machine = machine_cls()
+    sink = states - 1 if sinks else None
+    states = sink or states
+    for q in range(states):
+        secret = rng.choice(alphabet[:-1] if sinks else alphabet)
+        for a in alphabet:
+            if sinks and a == alphabet[-1]:
+                machine.add_transition(q, a, sink, "OFF")
+            elif a == secret:
+                machine.add_transition(q, a, min(q + 1, states - 1), symbols[(q + 1) % outputs])
+            else:
+                machine.add_transition(q, a, 0, symbols[0])
+    if sinks:
+        for a in alphabet:
+            machine.add_transition(sink, a, sink, "OFF")
+    machine.initial_state = 0
+    return machine, alphabet
+
+
+GENERATORS = {"random": random_machine, "chain": chain_machine}
+
+
+def variants():
+    for name in LEARNERS:
+        for eq in EQ_METHODS:
+            for ce in CE_STRATEGIES:
+                yield {"learner": name, "engine": "lstar", "ce_strategy": ce, "eq_method": eq}
+            yield {"learner": name, "engine": "kv", "ce_strategy": "rs", "eq_method": eq}
+
+
+def run_variant(target, alphabet, variant, seed):
+    module = LEARNERS[variant["learner"]]
+    teacher = MachineTeacher(target)
+    oracle = ConformanceOracle(alphabet, variant["eq_method"], module.EXTRA_STATES) if variant["eq_method"] != "random" else None
+    random.seed(seed) # The random EQ oracle draws from the module-level RNG
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        learner = module.LStarMealy(alphabet, None, teacher, variant["ce_strategy"], oracle)
+        rounds = [0]
+        eq = learner.equivalence_query
+
+        def counted_eq(hyp):
+            rounds[0] += 1
+            return eq(hyp)
+
+        learner.equivalence_query = counted_eq
+        if variant["engine"] == "kv":
+            model = KVLearner(learner.alphabet, learner.query, counted_eq, module.MealyMachine, learner.prefetch, learner.mq_cache).run()
+        else:
+            model = learner.run()
+        if hasattr(learner, "decode_machine"):
+            model = learner.decode_machine(model) # Learners on interned symbols
+        model = minimize_mealy(model, alphabet)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return dict(variant,
+                membership_queries=teacher.queries,
+                symbols=teacher.symbols,
+                eq_rounds=rounds[0],
+                seconds=round(elapsed, 4),
+                peak_bytes=peak,
+                learned_states=len(model.transitions),
+                correct=distinguishing_word(model, target, alphabet) is None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the learners against synthetic Mealy machines; prints JSON lines.")
+    parser.add_argument("--kind", choices=sorted(GENERATORS), nargs="+", default=["random", "chain"])
+    parser.add_argument("--states", type=int, nargs="+", default=[5, 20, 50])
+    parser.add_argument("--inputs", type=int, default=4)
+    parser.add_argument("--outputs", type=int, default=3)
+    parser.add_argument("--sinks", type=int, default=1)
+    parser.add_argument("--seeds", type=int, default=3)
+    parser.add_argument("--only", default="", help="Run only variants whose learner/engine/ce/eq contain this text")
+    parser.add_argument("--out", help="Also append the results to this file")
+    args = parser.parse_args()
+    out = open(args.out, "a") if args.out else None
+    for kind in args.kind:
+        for states in args.states:
+            for seed in range(args.seeds):
+                target, alphabet = GENERATORS[kind](Lstar_fast.MealyMachine, states, args.inputs, args.outputs, args.sinks, seed)
+                for variant in variants():
+                    if args.only not in "/".join(variant.values()):
+                        continue
+                    result = dict(kind=kind, states=states, inputs=args.inputs, outputs=args.outputs,
+                                  sinks=args.sinks, seed=seed, **run_variant(target, alphabet, variant, seed))
+                    line = json.dumps(result)
+                    print(line, flush=True)
+                    if out:
+                        out.write(line + "\n")
+    if out:
+        out.close()
@@ -1,8 +1,23 @@
+import argparse
+import logging
+import os
+import shutil
+import signal
+import sys
+import tempfile
+
 from pyftpdlib.authorizers import DummyAuthorizer
 from pyftpdlib.handlers import FTPHandler
-from pyftpdlib.servers import FTPServer
+from pyftpdlib.log import config_logging
+from pyftpdlib.servers import FTPServer, ThreadedFTPServer
+
+from sut_farm import probe
+
+MAX_CONS = 4096 # Harness: concurrent sessions across the server (0 = unlimited)
+BACKLOG = 4096 # Harness: learners open hundreds of short sessions per second
+IDLE_TIMEOUT = 30 # Harness: seconds before an idle control connection is dropped
 
-def start_ftp_server():
+def start_ftp_server(port=2121):
     # Create user manager
     authorizer = DummyAuthorizer()
 
@@ -22,13 +37,139 @@ def start_ftp_server():
     handler.authorizer = authorizer
 
     # Server address
-    address = ("127.0.0.1", 2121)
+    address = ("127.0.0.1", port)
 
     # Create server
     server = FTPServer(address, handler)
 
-    print("FTP Server running on port 2121...")
+    print(f"FTP Server running on port {port}...")
     server.serve_forever()
 
+class IsolatedHandler(FTPHandler):
+    """FTPHandler whose every login gets its own disposable home directory.
+
+    The directory is created (from `template`, if set) under `root` at
+    login and deleted on REIN, re-USER and disconnect, so no session sees
+    another's files and the shared working tree is never touched.
+    """
+    root = None
+    template = None
+    session_home = None
+
+    def handle_auth_success(self, home, password, msg_login):
+        self.session_home = tempfile.mkdtemp(prefix="session_", dir=self.root)
+        if self.template:
+            shutil.copytree(self.template, self.session_home, dirs_exist_ok=True)
+        super().handle_auth_success(self.session_home, password, msg_login)
+
+    def discard_home(self):
+        if self.session_home is not None:
+            shutil.rmtree(self.session_home, ignore_errors=True)
+            self.session_home = None
+
+    def flush_account(self):
+        super().flush_account()
+        self.discard_home()
+
+    def on_disconnect(self):
+        self.discard_home()
+
+def start_harness(port=2121, workers=0, threaded=False, template=None, ready_file=None):
+    """Serve the same account for load: pre-forked (or threaded) pyftpdlib
+    with raised connection limits and per-session homes. workers <= 0
+    forks one process per core. `ready_file` is created once the port is
+    listening; is_ready() probes for a greeting instead.
+    """
+    root = tempfile.mkdtemp(prefix=f"lstarimpy{port}_")
+    authorizer = DummyAuthorizer()
+    authorizer.add_user("user", "12345", root, perm="elradfmw")
+
+    handler = IsolatedHandler
+    handler.authorizer = authorizer
+    handler.root = root
+    handler.template = template
+    handler.timeout = IDLE_TIMEOUT
+
+    # Per-command INFO logging costs more than the commands themselves
+    config_logging(level=logging.WARNING)
+    server_cls = ThreadedFTPServer if threaded else FTPServer
+    server = server_cls(("127.0.0.1", port), handler, backlog=BACKLOG)
+    server.max_cons = MAX_CONS
+    server.max_cons_per_ip = 0 # Every learner session comes from localhost
+
+    if ready_file:
+        open(ready_file, "w").close()
+    workers = 1 if threaded else workers if workers > 0 else os.cpu_count()
+    mode = "threaded" if threaded else f"{workers} processes"
+    print(f"FTP harness running on port {port} ({mode})...")
+    # Let a plain terminate() (e.g. from sut_farm) unwind and remove the homes
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    children = set()
+    try:
+        if workers == 1:
+            server.serve_forever()
+        else:
+            prefork(server, workers, children)
+    finally:
+        # Only the parent gets here; the workers must be gone before their root is
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        server.close_all()
+        shutil.rmtree(root, ignore_errors=True)
+
+def prefork(server, workers, children):
+    """Serve from `workers` forked processes, restarting any that dies abnormally.
+
+    Unlike pyftpdlib's own pre-fork, the pids land in `children`, so the
+    parent can pass its SIGTERM on. Workers inherit the SIGTERM handler,
+    which pyftpdlib's handle_exit turns into a clean shutdown.
+    """
+    restarts = 0
+    while True:
+        while len(children) < workers:
+            pid = os.fork()
+            if pid == 0:
+                # Never unwind into the parent's cleanup from a worker
+                try:
+                    server.serve_forever()
+                except BaseException:
+                    logging.exception("Harness worker %d failed", os.getpid())
+                    os._exit(1)
+                os._exit(0)
+            children.add(pid)
+        pid, status = os.wait()
+        children.discard(pid)
+        if os.waitstatus_to_exitcode(status) == 0:
+            workers -= 1
+            if not workers:
+                return
+            continue
+        restarts += 1
+        if restarts > 100:
+            raise RuntimeError("Too many worker restarts, giving up")
+
+def is_ready(port=2121, host="127.0.0.1"):
+    """Readiness probe: the harness accepts a connection and greets with 220."""
+    return probe(host, port)
+
 if __name__ == "__main__":
-    start_ftp_server()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="pyftpdlib target for the learners.")
+    parser.add_argument("port", type=int, nargs="?", default=2121)
+    parser.add_argument("--harness", action="store_true", help="Multi-process server with isolated per-session homes")
+    parser.add_argument("--workers", type=int, default=0, help="Harness processes (0: one per core)")
+    parser.add_argument("--threaded", action="store_true", help="Harness with a thread per session instead of processes")
+    parser.add_argument("--template", help="Directory copied into each session's home")
+    parser.add_argument("--ready-file", help="Created once the harness is listening")
+    args = parser.parse_args()
+    if args.harness:
+        start_harness(args.port, args.workers, args.threaded, args.template, args.ready_file)
+    else:
+        start_ftp_server(args.port)
\ No newline at end of file
@@ -0,0 +1,195 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import ContextDecorator
+
+# Upper bounds in seconds, Prometheus-style; the last bucket is +Inf
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = "lstar_"
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = 0
+        while i < len(LATENCY_BUCKETS) and value > LATENCY_BUCKETS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (None if empty).
+
+        The overflow bucket is reported as "+Inf", as in the Prometheus
+        output: json.dumps would write float("inf") as Infinity, which
+        strict JSON parsers reject.
+        """
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, n in zip(LATENCY_BUCKETS, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return "+Inf"
+
+
+class Metrics:
+    """Counters, latency histograms and per-phase wall time for a learning run.
+
+    Thread-safe, since the teachers answer queries from a worker pool.
+    `snapshot()` is the JSON form and `prometheus()` the text exposition
+    format; `Reporter` writes both periodically.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {}
+        self.histograms = {}
+        self.phases = {}
+
+    def inc(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, seconds):
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(seconds)
+
+    def add_phase(self, name, seconds):
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def phase(self, name):
+        """Time a learner phase: `with metrics.phase("equivalence"):` or as a decorator."""
+        return _Phase(self, name)
+
+    def instrument_query(self, fn):
+        """Wrap a teacher's membership_query(sequence) to count and time it.
+
+        "OFF" answers are counted per symbol, as they are what timeouts and
+        dropped sessions turn into. Sessions are counted by FTPClient, which
+        knows a fresh connection ("connections") from a reused one
+        ("session_reuses").
+        """
+        @functools.wraps(fn)
+        def wrapper(*args):
+            sequence = args[-1]
+            start = time.perf_counter()
+            outputs = fn(*args)
+            self.observe("query_seconds", time.perf_counter() - start)
+            off = sum(1 for o in outputs if o == "OFF")
+            with self.lock:
+                for name, n in (("queries", 1), ("symbols", len(sequence)), ("off_results", off)):
+                    self.counters[name] = self.counters.get(name, 0) + n
+            return outputs
+        return wrapper
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "time": round(time.time(), 3),
+                "uptime": round(time.time() - self.started, 3),
+                "counters": dict(self.counters),
+                "phases": {k: round(v, 6) for k, v in self.phases.items()},
+                "histograms": {k: {"count": h.count, "sum": round(h.total, 6),
+                                   "p50": h.quantile(0.5), "p90": h.quantile(0.9), "p99": h.quantile(0.99),
+                                   "buckets": list(h.counts)}
+                               for k, h in self.histograms.items()},
+            }
+
+    def prometheus(self):
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {PREFIX}{name}_total counter")
+                lines.append(f"{PREFIX}{name}_total {value}")
+            if self.phases:
+                lines.append(f"# TYPE {PREFIX}phase_seconds_total counter")
+                for name, value in sorted(self.phases.items()):
+                    lines.append(f'{PREFIX}phase_seconds_total{{phase="{name}"}} {value:.6f}')
+            for name, h in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+                seen = 0
+                for bound, n in zip(LATENCY_BUCKETS, h.counts):
+                    seen += n
+                    lines.append(f'{PREFIX}{name}_bucket{{le="{bound}"}} {seen}')
+                lines.append(f'{PREFIX}{name}_bucket{{le="+Inf"}} {h.count}')
+                lines.append(f"{PREFIX}{name}_sum {h.total:.6f}")
+                lines.append(f"{PREFIX}{name}_count {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+class _Phase(ContextDecorator):
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def _recreate_cm(self):
+        # A fresh timer per decorated call, so phases may nest or recurse
+        return _Phase(self.metrics, self.name)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.add_phase(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Reporter:
+    """Every `interval` seconds, append a JSON snapshot line to `log_path` and
+    rewrite the Prometheus text file `prom_path` (atomically, for scrapers).
+    Either path may be None. A last report is written on close().
+    """
+
+    def __init__(self, metrics, log_path=None, prom_path=None, interval=10.0):
+        self.metrics = metrics
+        self.log_path = log_path
+        self.prom_path = prom_path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def _loop(self):
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    def report(self):
+        if self.log_path:
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps(self.metrics.snapshot()) + "\n")
+        if self.prom_path:
+            tmp = self.prom_path + ".tmp"
+            with open(tmp, "w") as f:
+                f.write(self.metrics.prometheus())
+            os.replace(tmp, self.prom_path)
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.report()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Process-wide registry the learner scripts and teachers report into
+metrics = Metrics()
@@ -0,0 +1,80 @@
+def minimize_mealy(machine, alphabet):
+    """Hopcroft-style partition refinement, O(n·|Σ|·log n).
+
+    States are numbered 0..n-1 and `block_of` maps each to its block, so a
+    splitter only touches the predecessors of the states in it. A missing
+    transition behaves like `simulate`: it outputs "OFF" and stays put.
+    The result keeps only states reachable from the initial state,
+    numbered in BFS order so the initial state is 0.
+    """
+    states = [machine.initial_state] + list(machine.transitions)
+    for trans in machine.transitions.values():
+        states.extend(next_state for next_state, _ in trans.values())
+    states = list(dict.fromkeys(states))
+    num = {s: i for i, s in enumerate(states)}
+    n = len(states)
+
+    succ = [[0] * len(alphabet) for _ in range(n)]
+    inv = [[[] for _ in range(n)] for _ in alphabet]
+    blocks_by_outputs = {}
+    for i, s in enumerate(states):
+        trans = machine.transitions.get(s, {})
+        outputs = []
+        for k, a in enumerate(alphabet):
+            next_state, output = trans.get(a, (s, "OFF"))
+            j = num[next_state]
+            succ[i][k] = j
+            inv[k][j].append(i)
+            outputs.append(output)
+        blocks_by_outputs.setdefault(tuple(outputs), []).append(i)
+
+    blocks = [set(members) for members in blocks_by_outputs.values()]
+    block_of = [0] * n
+    for b, members in enumerate(blocks):
+        for i in members:
+            block_of[i] = b
+
+    pending = {(b, k) for b in range(len(blocks)) for k in range(len(alphabet))}
+    worklist = list(pending)
+    while worklist:
+        splitter = worklist.pop()
+        pending.discard(splitter)
+        b, k = splitter
+        touched = {}
+        for j in blocks[b]:
+            for i in inv[k][j]:
+                touched.setdefault(block_of[i], []).append(i)
+        for y, moved in touched.items():
+            if len(moved) == len(blocks[y]):
+                continue
+            new = len(blocks)
+            blocks.append(set(moved))
+            blocks[y].difference_update(moved)
+            for i in moved:
+                block_of[i] = new
+            for c in range(len(alphabet)):
+                if (y, c) in pending:
+                    split = (new, c)
+                else:
+                    # Only the smaller half needs processing: that's the log n
+                    split = (new, c) if len(blocks[new]) <= len(blocks[y]) else (y, c)
+                pending.add(split)
+                worklist.append(split)
+
+    minimized = type(machine)()
+    start = block_of[num[machine.initial_state]]
+    ids = {start: 0}
+    queue = [start]
+    for b in queue:
+        rep = next(iter(blocks[b]))
+        trans = machine.transitions.get(states[rep], {})
+        for k, a in enumerate(alphabet):
+            if a not in trans:
+                continue
+            target = block_of[succ[rep][k]]
+            if target not in ids:
+                ids[target] = len(ids)
+                queue.append(target)
+            minimized.add_transition(ids[b], a, ids[target], trans[a][1])
+    minimized.initial_state = 0
+    return minimized
@@ -0,0 +1,155 @@
+import argparse
+import json
+import sys
+
+
+def _transitions(machine):
+    """(transitions, initial state) in MealyMachine's dict form; a CompactMealy is converted.
+
+    A missing transition outputs "OFF" and stays put, as in simulate().
+    Plain machines need no NumPy, so compact_mealy is never imported here.
+    """
+    if hasattr(machine, "transitions"):
+        return machine.transitions, machine.initial_state
+    k = len(machine.inputs)
+    names = machine.outputs
+    transitions = {}
+    for q, (row, outs) in enumerate(zip(machine.next_state[:, :k].tolist(), machine.output[:, :k].tolist())):
+        transitions[machine.states[q]] = {a: (machine.states[t], names[o]) for a, t, o in zip(machine.inputs, row, outs)}
+    return transitions, machine.states[machine.initial_state]
+
+
+def _alphabet(*tables):
+    symbols = {}
+    for transitions in tables:
+        for trans in transitions.values():
+            symbols.update(dict.fromkeys(trans))
+    return list(symbols)
+
+
+def distinguishing_word(a, b, alphabet=None):
+    """A shortest input word on which `a` and `b` answer differently, or None if they are equivalent.
+
+    Breadth-first search of the product machine from the pair of initial
+    states: each reachable pair is expanded once, so this is O(n·m·|Σ|)
+    at worst and usually near O((n + m)·|Σ|) for similar models. Either
+    model may be a MealyMachine or a CompactMealy.
+    """
+    ta, init_a = _transitions(a)
+    tb, init_b = _transitions(b)
+    return _shortest_difference(ta, init_a, tb, init_b, list(alphabet) if alphabet is not None else _alphabet(ta, tb))
+
+
+def _shortest_difference(ta, init_a, tb, init_b, alphabet):
+    start = (init_a, init_b)
+    parent = {start: None} # Pair -> (previous pair, input)
+    queue = [start]
+    for pair in queue:
+        p, q = pair
+        row_p, row_q = ta.get(p, {}), tb.get(q, {})
+        for x in alphabet:
+            p2, out_p = row_p.get(x, (p, "OFF"))
+            q2, out_q = row_q.get(x, (q, "OFF"))
+            if out_p != out_q:
+                word = [x]
+                while parent[pair] is not None:
+                    pair, x = parent[pair]
+                    word.append(x)
+                return tuple(reversed(word))
+            nxt = (p2, q2)
+            if nxt not in parent:
+                parent[nxt] = (pair, x)
+                queue.append(nxt)
+    return None
+
+
+def diff_models(a, b, alphabet=None):
+    """Compare model `a` (old) with `b` (new).
+
+    The report holds `equivalent` and a shortest `counterexample` with both
+    models' outputs on it, plus a structural diff: states are matched in
+    BFS order of the product (the first pair that reaches an unmatched
+    state of each side pairs them up, so matched states share a shortest
+    access word), reachable states left unmatched are `removed` (in `a`)
+    or `added` (in `b`), and `changed` lists the transitions of matched
+    states whose output differs or whose target isn't the matched state.
+    """
+    ta, init_a = _transitions(a)
+    tb, init_b = _transitions(b)
+    alphabet = list(alphabet) if alphabet is not None else _alphabet(ta, tb)
+    match_a, match_b = {init_a: init_b}, {init_b: init_a}
+    seen = {(init_a, init_b)}
+    queue = [(init_a, init_b)]
+    for p, q in queue:
+        row_p, row_q = ta.get(p, {}), tb.get(q, {})
+        for x in alphabet:
+            p2 = row_p.get(x, (p,))[0]
+            q2 = row_q.get(x, (q,))[0]
+            if p2 not in match_a and q2 not in match_b:
+                match_a[p2], match_b[q2] = q2, p2
+            if (p2, q2) not in seen:
+                seen.add((p2, q2))
+                queue.append((p2, q2))
+    changed = []
+    for p, q in match_a.items():
+        row_p, row_q = ta.get(p, {}), tb.get(q, {})
+        for x in alphabet:
+            p2, out_p = row_p.get(x, (p, "OFF"))
+            q2, out_q = row_q.get(x, (q, "OFF"))
+            if out_p != out_q or match_a.get(p2) != q2:
+                changed.append({"state": p, "matched": q, "input": x, "old": [p2, out_p], "new": [q2, out_q]})
+    word = _shortest_difference(ta, init_a, tb, init_b, alphabet)
+    reach_a, reach_b = _reachable(ta, init_a, alphabet), _reachable(tb, init_b, alphabet)
+    return {
+        "equivalent": word is None,
+        "counterexample": word,
+        "old_outputs": list(a.simulate(word)) if word else None,
+        "new_outputs": list(b.simulate(word)) if word else None,
+        "states": [len(reach_a), len(reach_b)],
+        "removed": [p for p in reach_a if p not in match_a],
+        "added": [q for q in reach_b if q not in match_b],
+        "changed": changed,
+    }
+
+
+def _reachable(transitions, initial, alphabet):
+    # BFS order, so the lists in a report read from the initial state outwards
+    order = [initial]
+    seen = {initial}
+    for s in order:
+        row = transitions.get(s, {})
+        for x in alphabet:
+            t = row.get(x, (s,))[0]
+            if t not in seen:
+                seen.add(t)
+                order.append(t)
+    return order
+
+
+def format_report(report):
+    lines = [f"States: {report['states'][0]} -> {report['states'][1]}"]
+    if report["equivalent"]:
+        lines.append("Equivalent")
+    else:
+        lines.append(f"Distinguishing word: {list(report['counterexample'])}")
+        lines.append(f"  old: {report['old_outputs']}")
+        lines.append(f"  new: {report['new_outputs']}")
+    if report["removed"]:
+        lines.append(f"Removed states: {report['removed']}")
+    if report["added"]:
+        lines.append(f"Added states: {report['added']}")
+    for c in report["changed"]:
+        lines.append(f"  {c['state']}~{c['matched']} --{c['input']}--> {c['old'][0]} / {c['old'][1]}  became  {c['new'][0]} / {c['new'][1]}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    from compact_mealy import CompactMealy
+    parser = argparse.ArgumentParser(description="Compare two models saved with CompactMealy.save; exits 1 if they differ.")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+    report = diff_models(CompactMealy.load(args.old), CompactMealy.load(args.new))
+    print(json.dumps(report) if args.json else format_report(report))
+    sys.exit(0 if report["equivalent"] else 1)
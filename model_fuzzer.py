@@ -0,0 +1,186 @@
+import json
+import random
+import time
+
+from counterexamples import state_after
+from eq_oracles import access_sequences
+from ftp_client import CLOSING_CODES, TargetUnreachable
+from metrics import metrics
+
+# RFC 959, 2228, 2389, 2428 and 3659 verbs, for verb swaps
+VERBS = ["USER", "PASS", "ACCT", "CWD", "CDUP", "SMNT", "REIN", "QUIT", "PORT", "PASV", "TYPE", "STRU", "MODE",
+         "RETR", "STOR", "STOU", "APPE", "ALLO", "REST", "RNFR", "RNTO", "ABOR", "DELE", "RMD", "MKD", "PWD",
+         "LIST", "NLST", "SITE", "SYST", "STAT", "HELP", "NOOP", "AUTH", "ADAT", "PROT", "PBSZ", "CCC", "MIC",
+         "CONF", "ENC", "FEAT", "OPTS", "EPRT", "EPSV", "MDTM", "SIZE", "MLST", "MLSD", "XCWD", "XMKD", "XPWD"]
+# Arguments that tend to break parsers; none contains CR or LF, which would split the command
+ARGUMENTS = ["", " ", "A" * 256, "A" * 4096, "%s%s%s%s%n", "%x" * 64, "../" * 32 + "etc/passwd", "/" * 1024,
+             "-1", "0", "2147483648", "18446744073709551616", "*", "*" * 256, "~root", "\x00", "\x7f" * 16,
+             "é中\U0001f600", "127,0,0,1,0,21", "|2|::1|21|", "A,B,C", "UTF8 ON", "I", "E"]
+PRINTABLE = [chr(c) for c in range(0x20, 0x7f)]
+MAX_ARGUMENT = 16384 # Longer lines only measure how fast the target discards them
+
+
+class ModelFuzzer:
+    """Stateful fuzzer that uses a learned MealyMachine to reach every state.
+
+    Each session is the shortest access sequence of a state followed by a
+    few commands mutated from that state's corpus (seeded with the
+    alphabet): swapped or mangled verbs, dictionary or stretched arguments,
+    inserted and dropped commands. Sessions go out `teacher.workers` at a
+    time through the teacher's `query_batch`.
+
+    A session whose replies after the access sequence were never seen from
+    that state is new behaviour: its commands join the state's corpus and
+    the state's weight goes up. States are picked with weight
+    (1 + finds) / sqrt(1 + execs), so the fuzzer keeps to states that
+    still surprise it without starving the rest.
+
+    Findings are appended to `findings_path` as JSON lines, once per
+    distinct key:
+      deviation  the replies to the alphabet-only prefix differ from the
+                 model's; `counterexample` is the shortest such prefix,
+                 reported once per wrong model transition
+      no_reply   the session went silent or was dropped without a
+                 closing reply
+      crash      as no_reply, and `alive()` then says the target is down,
+                 or a batch found the target refusing new sessions
+                 (`word` is then the whole batch); fuzzing stops, since
+                 nothing more can be learned
+    """
+
+    def __init__(self, model, alphabet, teacher, alive=None, max_commands=3, seed=None, findings_path=None):
+        self.model = model
+        self.alphabet = list(alphabet)
+        self.known = set(self.alphabet)
+        self.teacher = teacher
+        self.alive = alive
+        self.max_commands = max_commands
+        self.rng = random.Random(seed)
+        self.findings_path = findings_path
+        self.access = access_sequences(model, self.alphabet)
+        self.states = list(self.access)
+        self.corpus = {q: [(a,) for a in self.alphabet] for q in self.states}
+        self.execs = dict.fromkeys(self.states, 0)
+        self.finds = dict.fromkeys(self.states, 0)
+        self.seen = set()
+        self.findings = []
+        self.finding_keys = set()
+        self.crashed = False
+
+    def mutate_command(self, cmd):
+        rng = self.rng
+        verb, _, arg = cmd.partition(" ")
+        op = rng.randrange(6)
+        if op == 0:
+            arg = rng.choice(ARGUMENTS)
+        elif op == 1:
+            verb = rng.choice(VERBS)
+        elif op == 2:
+            verb = "".join(c.swapcase() if rng.random() < 0.5 else c for c in verb)
+        elif op == 3:
+            arg = ((arg or "A") * rng.choice((2, 16, 256, 2048)))[:MAX_ARGUMENT]
+        elif op == 4:
+            arg = (arg + " " + rng.choice(ARGUMENTS)).strip()
+        else:
+            chars = list(cmd) or [" "]
+            chars[rng.randrange(len(chars))] = rng.choice(PRINTABLE)
+            return "".join(chars)
+        return f"{verb} {arg}" if arg else verb
+
+    def mutate(self, commands):
+        rng = self.rng
+        commands = list(commands)
+        for _ in range(rng.randint(1, 3)):
+            op = rng.randrange(4)
+            if op == 0 or not commands:
+                commands.insert(rng.randint(0, len(commands)), rng.choice(self.alphabet))
+            elif op == 1 and len(commands) > 1:
+                del commands[rng.randrange(len(commands))]
+            else:
+                i = rng.randrange(len(commands))
+                commands[i] = self.mutate_command(commands[i])
+        return tuple(commands[:self.max_commands])
+
+    def pick_state(self):
+        weights = [(1 + self.finds[q]) / (1 + self.execs[q]) ** 0.5 for q in self.states]
+        return self.rng.choices(self.states, weights)[0]
+
+    def record(self, kind, key, **details):
+        if key in self.finding_keys:
+            return
+        self.finding_keys.add(key)
+        finding = dict(kind=kind, time=round(time.time(), 3), **details)
+        self.findings.append(finding)
+        metrics.inc("fuzz_findings")
+        print(f"Fuzz finding ({kind}) in state {details['state']}: {str(details.get('counterexample') or details['word'])[:200]}")
+        if self.findings_path:
+            with open(self.findings_path, "a") as f:
+                f.write(json.dumps(finding) + "\n")
+
+    def check(self, state, word, outputs):
+        access = self.access[state]
+        self.execs[state] += 1
+        key = (state, tuple(outputs[len(access):]))
+        if key not in self.seen:
+            self.seen.add(key)
+            self.corpus[state].append(word[len(access):])
+            self.finds[state] += 1
+            metrics.inc("fuzz_new_responses")
+        # The model only predicts the commands it was learned on
+        n = 0
+        while n < len(word) and word[n] in self.known:
+            n += 1
+        expected = self.model.simulate(word[:n])
+        for i in range(n):
+            if outputs[i] != expected[i]:
+                # One finding per wrong model transition, however many words show it
+                self.record("deviation", ("deviation", state_after(self.model, word[:i]), word[i]), state=state, counterexample=word[:i + 1],
+                            outputs=outputs[:i + 1], expected=expected[:i + 1])
+                break
+        for i, output in enumerate(outputs):
+            if output != "OFF":
+                continue
+            if i and outputs[i - 1] in CLOSING_CODES or i < n and expected[i] == "OFF":
+                break
+            verb = word[i].partition(" ")[0].upper()
+            if self.alive is not None and not self.alive():
+                self.crashed = True
+                self.record("crash", ("crash", state, verb), state=state, word=word, outputs=outputs)
+            else:
+                self.record("no_reply", ("no_reply", state, verb), state=state, word=word, outputs=outputs)
+            break
+
+    def run(self, seconds=None, execs=None, report_interval=10.0):
+        """Fuzz until `seconds` have passed, `execs` sessions were run or the target crashed."""
+        start = last = time.monotonic()
+        done = 0
+        with metrics.phase("fuzz"):
+            while not self.crashed and (execs is None or done < execs):
+                now = time.monotonic()
+                if seconds is not None and now - start >= seconds:
+                    break
+                if now - last >= report_interval:
+                    last = now
+                    print(f"Fuzzing: {done} execs, {done / (now - start):.0f}/s, corpus {self.corpus_size()}, {len(self.findings)} findings")
+                batch = []
+                for _ in range(self.teacher.workers):
+                    state = self.pick_state()
+                    batch.append((state, self.access[state] + self.mutate(self.rng.choice(self.corpus[state]))))
+                try:
+                    answers = self.teacher.query_batch([w for _, w in batch])
+                except TargetUnreachable as e:
+                    self.crashed = True
+                    self.record("crash", ("crash", "unreachable"), state=None, word=[w for _, w in batch], error=str(e))
+                    break
+                for (state, word), outputs in zip(batch, answers):
+                    self.check(state, word, outputs)
+                done += len(batch)
+                metrics.inc("fuzz_execs", len(batch))
+        elapsed = time.monotonic() - start
+        summary = {"execs": done, "execs_per_sec": round(done / elapsed, 1) if elapsed else 0.0,
+                   "corpus": self.corpus_size(), "findings": len(self.findings), "crashed": self.crashed}
+        print(f"Fuzzing done: {summary}")
+        return summary
+
+    def corpus_size(self):
+        return sum(len(seeds) for seeds in self.corpus.values())
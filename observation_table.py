@@ -0,0 +1,108 @@
+class ObservationTable:
+    """L* observation table that keeps every row signature between rounds.
+
+    Rows are stored per prefix (for S and S·Σ) and only grow by the columns
+    of newly added suffixes. S is indexed by signature, so closedness and
+    consistency only re-examine prefixes added since the last check; a new
+    suffix re-examines everything once, since it may split any class.
+
+    `entry(prefix, suffix)` supplies one cell and should be answerable from
+    the query cache once `missing_words()` has been asked.
+    """
+
+    def __init__(self, alphabet, entry):
+        self.alphabet = alphabet
+        self.entry = entry
+        self.S = []
+        self.members = set()
+        self.E = [()]
+        self.rows = {}
+        self.index = {}
+        self.unchecked = {}
+        self.dirty = {}
+        self.new_S = []
+        self.rebuild = False
+        self.add_prefix(())
+
+    def add_prefix(self, s):
+        if s in self.members:
+            return
+        self.S.append(s)
+        self.members.add(s)
+        self.new_S.append(s)
+        for p in (s,) + tuple(s + (a,) for a in self.alphabet):
+            self.rows.setdefault(p, ())
+        for a in self.alphabet:
+            self.unchecked[s + (a,)] = None
+
+    def add_suffix(self, e):
+        if e in self.E:
+            return False
+        self.E.append(e)
+        self.rebuild = True
+        return True
+
+    def missing_words(self):
+        """Words whose answers are needed to complete every row."""
+        n = len(self.E)
+        return [p + e for p, r in self.rows.items() if len(r) < n for e in self.E[len(r):]]
+
+    def update(self):
+        n = len(self.E)
+        for p, r in self.rows.items():
+            if len(r) < n:
+                self.rows[p] = r + tuple(self.entry(p, e) for e in self.E[len(r):])
+        if self.rebuild:
+            self.index = {}
+            for s in self.S:
+                self.index.setdefault(self.rows[s], []).append(s)
+            self.unchecked = dict.fromkeys(s + (a,) for s in self.S for a in self.alphabet)
+            self.dirty = dict.fromkeys(self.S)
+            self.rebuild = False
+        else:
+            for s in self.new_S:
+                self.index.setdefault(self.rows[s], []).append(s)
+                self.dirty[s] = None
+        self.new_S = []
+
+    def row(self, p):
+        return self.rows[p]
+
+    def find_unclosed(self):
+        # The index only grows until the next suffix, so a closed row stays closed
+        closed = []
+        found = None
+        for p in self.unchecked:
+            if self.rows[p] in self.index:
+                closed.append(p)
+            else:
+                found = p
+                break
+        for p in closed:
+            del self.unchecked[p]
+        return found
+
+    def find_inconsistent(self):
+        # Equal rows are transitive, so each prefix only needs comparing with its class representative
+        rows = self.rows
+        checked = []
+        found = None
+        for s in self.dirty:
+            rep = self.index[rows[s]][0]
+            if rep != s:
+                for a in self.alphabet:
+                    if rows[rep + (a,)] != rows[s + (a,)]:
+                        found = (rep, s, a)
+                        break
+            if found:
+                break
+            checked.append(s)
+        for s in checked:
+            del self.dirty[s]
+        return found
+
+    def distinguishing_suffix(self, p1, p2):
+        for e, o1, o2 in zip(self.E, self.rows[p1], self.rows[p2]):
+            if o1 != o2:
+                return e
+        return None
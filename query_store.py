@@ -0,0 +1,76 @@
+import json
+import socket
+import sqlite3
+
+
+def fetch_banner(host, port, timeout=1.0):
+    """Read the greeting line so different server builds on one port get separate stores."""
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as sock:
+            return sock.recv(1024).decode(errors="ignore").strip()
+    except OSError:
+        return ""
+
+
+class QueryStore:
+    """SQLite-backed membership-query log shared across learning runs.
+
+    Rows are keyed by target (host, port, banner) and input word. `load`
+    bulk-inserts everything known for the target into a QueryTrie, and new
+    answers are buffered and written `batch_size` at a time. Like the trie,
+    the store keeps the first answer to a word and ignores later ones.
+    """
+
+    def __init__(self, path, host, port, banner="", batch_size=256):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS queries ("
+            " host TEXT, port INTEGER, banner TEXT, word TEXT, outputs TEXT,"
+            " PRIMARY KEY (host, port, banner, word))"
+        )
+        self.conn.commit()
+        self.target = (host, port, banner)
+        self.batch_size = batch_size
+        self.pending = []
+
+    def load(self, trie, encode=None):
+        """Insert every stored answer into `trie`.
+
+        `encode` maps a stored word to the trie's symbols, or to None to skip it.
+        """
+        rows = self.conn.execute(
+            "SELECT word, outputs FROM queries WHERE host = ? AND port = ? AND banner = ?",
+            self.target,
+        )
+        count = 0
+        for word, outputs in rows:
+            word = tuple(json.loads(word))
+            if encode is not None:
+                word = encode(word)
+                if word is None:
+                    continue
+            trie.insert(word, json.loads(outputs))
+            count += 1
+        return count
+
+    def add(self, word, outputs):
+        self.pending.append(self.target + (json.dumps(list(word)), json.dumps(list(outputs))))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        self.conn.executemany("INSERT OR IGNORE INTO queries VALUES (?, ?, ?, ?, ?)", self.pending)
+        self.conn.commit()
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,172 @@
+from array import array
+
+CLOSED = "OFF" # What the teachers answer once the session is gone
+
+
+class _TrieNode:
+    __slots__ = ("children", "output")
+
+    def __init__(self):
+        self.children = {}
+        self.output = None
+
+
+class QueryTrie:
+    """Membership-query cache stored as a prefix tree.
+
+    A query for `w` returns one output per symbol, so inserting it also
+    answers every prefix of `w`. Lookups never touch the network.
+
+    Outputs in `sinks` are absorbing: once a cached prefix produced one
+    (e.g. "221" after QUIT, or "OFF" once the session is gone), every
+    extension of it is answered "OFF" for the remaining symbols without
+    being stored or sent. `sink_hits` counts those answers in `lookup`.
+
+    Inserting never changes an output that is already cached: the first
+    answer wins and a disagreeing one only counts as a `conflict`, so a
+    flaky session can't rewrite the shared prefixes of good ones.
+    """
+
+    def __init__(self, sinks=()):
+        self.root = _TrieNode()
+        self.sinks = frozenset(sinks)
+        self.nodes = 0
+        self.hits = 0
+        self.misses = 0
+        self.sink_hits = 0
+        self.conflicts = 0
+
+    def insert(self, word, outputs):
+        node = self.root
+        for symbol, output in zip(word, outputs):
+            child = node.children.get(symbol)
+            if child is None:
+                child = node.children[symbol] = _TrieNode()
+                child.output = output
+                self.nodes += 1
+            elif child.output != output:
+                self.conflicts += 1
+            node = child
+
+    def _walk(self, word, count=False):
+        # Outputs along `word`, or None if it leaves the trie before a sink
+        node = self.root
+        outputs = []
+        for symbol in word:
+            child = node.children.get(symbol)
+            if child is None:
+                if node.output in self.sinks:
+                    self.sink_hits += count
+                    return outputs + [CLOSED] * (len(word) - len(outputs))
+                return None
+            outputs.append(child.output)
+            node = child
+        return outputs
+
+    def lookup(self, word):
+        """Return the outputs for every prefix of `word`, or None on a miss."""
+        outputs = self._walk(word, True)
+        if outputs is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return outputs
+
+    def peek(self, word):
+        """Like `lookup`, but without counting a hit or miss."""
+        return self._walk(word)
+
+    def edges(self, node):
+        """(symbol, child, child's output) for each child of `node`."""
+        for symbol, child in node.children.items():
+            yield symbol, child, child.output
+
+    def __contains__(self, word):
+        return self._walk(word) is not None
+
+    def __len__(self):
+        return self.nodes
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "nodes": self.nodes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "sink_hits": self.sink_hits,
+            "conflicts": self.conflicts,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class CompactQueryTrie(QueryTrie):
+    """QueryTrie over the integer alphabet 0..k-1, stored in one flat array.
+
+    A node is the offset of its k + 1 cells: `cells[node + symbol]` is the
+    child's offset (or -1) and `cells[node + k]` indexes `outputs`, so each
+    distinct output is kept once. A node costs 4·(k + 1) bytes instead of
+    an object and a dict, and a step is one array read.
+    """
+
+    def __init__(self, k, sinks=()):
+        self.k = k
+        self.blank = array("i", [-1]) * k + array("i", [0])
+        self.cells = array(self.blank.typecode, self.blank)
+        self.outputs = [None]
+        self.output_code = {}
+        self.root = 0
+        self.sinks = frozenset(sinks)
+        self.nodes = 0
+        self.hits = 0
+        self.misses = 0
+        self.sink_hits = 0
+        self.conflicts = 0
+
+    def insert(self, word, outputs):
+        cells, k = self.cells, self.k
+        node = 0
+        for symbol, output in zip(word, outputs):
+            code = self.output_code.get(output)
+            if code is None:
+                code = self.output_code[output] = len(self.outputs)
+                self.outputs.append(output)
+            next_node = cells[node + symbol]
+            if next_node < 0:
+                next_node = cells[node + symbol] = len(cells)
+                cells.extend(self.blank)
+                cells[next_node + k] = code
+                self.nodes += 1
+            elif cells[next_node + k] != code:
+                self.conflicts += 1
+            node = next_node
+
+    def _walk(self, word, count=False):
+        cells, k, names = self.cells, self.k, self.outputs
+        node = 0
+        outputs = []
+        for symbol in word:
+            next_node = cells[node + symbol]
+            if next_node < 0:
+                if names[cells[node + k]] in self.sinks:
+                    self.sink_hits += count
+                    return outputs + [CLOSED] * (len(word) - len(outputs))
+                return None
+            outputs.append(names[cells[next_node + k]])
+            node = next_node
+        return outputs
+
+    def edges(self, node):
+        cells, k = self.cells, self.k
+        for symbol in range(k):
+            next_node = cells[node + symbol]
+            if next_node >= 0:
+                yield symbol, next_node, self.outputs[cells[next_node + k]]
+
+
+def maximal_words(words):
+    """Deduplicate `words` and drop any word that is a prefix of another one.
+
+    After sorting, a word that prefixes anything also prefixes its successor.
+    """
+    ordered = sorted(set(words))
+    return [w for w, nxt in zip(ordered, ordered[1:] + [None]) if nxt is None or nxt[:len(w)] != w]
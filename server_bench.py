@@ -0,0 +1,55 @@
+import argparse
+import asyncio
+import json
+import time
+
+WORD = ["USER", "USER", "PASS", "LIST", "QUIT"]
+
+
+async def session(host, port, word, timeout):
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        await asyncio.wait_for(reader.readline(), timeout)
+        for cmd in word:
+            writer.write((cmd + "\r\n").encode())
+            if not await asyncio.wait_for(reader.readline(), timeout):
+                return False
+        return True
+    finally:
+        writer.close()
+
+
+async def bench(host, port, sessions, concurrency, timeout):
+    limit = asyncio.Semaphore(concurrency)
+    errors = {}
+
+    async def one():
+        async with limit:
+            try:
+                if not await session(host, port, WORD, timeout):
+                    errors["closed"] = errors.get("closed", 0) + 1
+            except Exception as e:
+                name = type(e).__name__
+                errors[name] = errors.get(name, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(sessions)))
+    elapsed = time.perf_counter() - start
+    return {
+        "sessions": sessions,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "sessions_per_sec": round(sessions / elapsed, 1),
+        "errors": errors,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure SUT throughput in complete sessions per second.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2121)
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=5.0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(bench(args.host, args.port, args.sessions, args.concurrency, args.timeout))))
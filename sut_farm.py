@@ -0,0 +1,165 @@
+import itertools
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from ftp_client import FTPClient, TargetUnreachable, read_reply
+from metrics import metrics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVERS = { # Command line of each server, less the port
+    "ftp_server2": [os.path.join(HERE, "ftp_server2.py")],
+    # One process per instance: the farm itself provides the parallelism
+    "lstarimpy": [os.path.join(HERE, "lstarimpy.py"), "--harness", "--workers", "1"],
+}
+
+
+def probe(host, port, timeout=1.0):
+    """True if something on host:port accepts a connection and sends a 2xx greeting."""
+    try:
+        with socket.create_connection((host, port), timeout) as sock:
+            sock.settimeout(timeout)
+            with sock.makefile("rb") as stream:
+                code = read_reply(stream)
+    except OSError:
+        return False
+    return code is not None and code.startswith("2")
+
+
+class Instance:
+    __slots__ = ("port", "process", "workdir", "healthy")
+
+    def __init__(self, port, process=None, workdir=None):
+        self.port = port
+        self.process = process # None when attached to a server we didn't start
+        self.workdir = workdir
+        self.healthy = True
+
+    def alive(self, host):
+        if self.process is not None and self.process.poll() is not None:
+            return False
+        return probe(host, self.port)
+
+
+class SUTFarm:
+    """N instances of a test server on consecutive ports from `base_port`.
+
+    `server` is a key of SERVERS. start() attaches to a port that already
+    answers and otherwise launches the server there in its own process,
+    with a fresh temporary working directory so no state (uploaded files,
+    lstarimpy's FTP root) is shared between instances. stop() only
+    terminates the processes it started.
+    """
+
+    def __init__(self, server, host, base_port, size, ready_timeout=10.0):
+        self.command = SERVERS[server]
+        self.host = host
+        self.ports = range(base_port, base_port + size)
+        self.ready_timeout = ready_timeout
+        self.instances = []
+
+    def start(self):
+        for port in self.ports:
+            if probe(self.host, port):
+                self.instances.append(Instance(port))
+                continue
+            workdir = tempfile.mkdtemp(prefix=f"sut{port}_")
+            process = subprocess.Popen([sys.executable, *self.command, str(port)], cwd=workdir,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            self.instances.append(Instance(port, process, workdir))
+        deadline = time.monotonic() + self.ready_timeout
+        for inst in self.instances:
+            while not inst.alive(self.host):
+                if time.monotonic() > deadline or (inst.process and inst.process.poll() is not None):
+                    inst.healthy = False
+                    print(f"Instance on port {inst.port} did not come up")
+                    break
+                time.sleep(0.05)
+        print(f"Target farm: {len(self.healthy())}/{len(self.instances)} instances up on ports {self.ports.start}-{self.ports.stop - 1}")
+        return self
+
+    def healthy(self):
+        return [inst for inst in self.instances if inst.healthy]
+
+    def stop(self):
+        for inst in self.instances:
+            if inst.process is not None:
+                inst.process.terminate()
+                inst.process.wait()
+                shutil.rmtree(inst.workdir, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class FarmDispatcher:
+    """Spreads membership queries round-robin over a farm's healthy instances.
+
+    Each instance gets its own FTPClient (so its own latency estimate,
+    backoff and connection pool). A query whose instance could not be
+    reached is sent to the next one, and the instance gets a health check:
+    if it fails it is taken out of rotation. Once every healthy instance
+    has refused the query, it raises TargetUnreachable rather than answer.
+    A background thread re-checks every instance each `check_interval`
+    seconds.
+    """
+
+    def __init__(self, farm, read_timeout, check_interval=5.0, **client_options):
+        self.farm = farm
+        self.clients = {inst.port: FTPClient(farm.host, inst.port, read_timeout, retries=1, **client_options)
+                        for inst in farm.instances}
+        self.lock = threading.Lock()
+        self.rotation = itertools.cycle(farm.healthy())
+        self.stopped = threading.Event()
+        self.checker = threading.Thread(target=self._check_loop, args=(check_interval,), daemon=True)
+        self.checker.start()
+
+    def _next(self, exclude=()):
+        with self.lock:
+            if not any(inst.port not in exclude for inst in self.farm.healthy()):
+                return None
+            inst = next(self.rotation)
+            while not inst.healthy or inst.port in exclude:
+                inst = next(self.rotation)
+            return inst
+
+    def _evict(self, inst):
+        with self.lock:
+            if not inst.healthy:
+                return
+            inst.healthy = False
+            metrics.inc("instances_evicted")
+            print(f"Target instance on port {inst.port} failed its health check, removed from rotation")
+            self.rotation = itertools.cycle(self.farm.healthy() or [inst])
+
+    def _check_loop(self, interval):
+        while not self.stopped.wait(interval):
+            for inst in self.farm.healthy():
+                if not inst.alive(self.farm.host):
+                    self._evict(inst)
+
+    def membership_query(self, sequence):
+        tried = set()
+        while True:
+            inst = self._next(tried)
+            if inst is None:
+                raise TargetUnreachable(f"no instance of the farm accepted a session ({len(tried)} tried)")
+            tried.add(inst.port)
+            try:
+                return self.clients[inst.port].membership_query(sequence)
+            except TargetUnreachable:
+                metrics.inc("farm_retries")
+                if not inst.alive(self.farm.host):
+                    self._evict(inst)
+
+    def close(self):
+        self.stopped.set()
+        self.checker.join()
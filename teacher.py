@@ -0,0 +1,118 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import metrics
+
+
+class ConcurrentTeacher:
+    """Runs membership queries on a thread pool.
+
+    `workers` is the number of sessions open against the target at once and
+    replaces the fixed per-query sleep. Identical words submitted while one
+    is still in flight share a single future.
+    """
+
+    def __init__(self, query_fn, workers=8):
+        self.query_fn = query_fn
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.inflight = {}
+        self.lock = threading.Lock()
+
+    def submit(self, word):
+        with self.lock:
+            future = self.inflight.get(word)
+            if future is not None:
+                return future
+            future = self.pool.submit(self.query_fn, word)
+            self.inflight[word] = future
+        # Outside the lock: the callback runs inline if the query already finished
+        future.add_done_callback(lambda f, w=word: self._done(w))
+        return future
+
+    def _done(self, word):
+        with self.lock:
+            self.inflight.pop(word, None)
+
+    def query(self, word):
+        return self.submit(word).result()
+
+    def query_batch(self, words):
+        futures = [self.submit(w) for w in words]
+        return [f.result() for f in futures]
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class InProcessTeacher:
+    """Answers membership queries by driving a protocol session object directly.
+
+    `session` must offer reset(), handle(line) -> reply or None, and
+    `closed`, like ftp_server2.FTPSession. Outputs match the socket
+    teachers: the 3-digit code per command, and "OFF" once the session is
+    closed or has gone silent. It has the same query/query_batch interface
+    as ConcurrentTeacher, so LStarMealy can take it as its teacher.
+    """
+
+    workers = 1
+
+    def __init__(self, session):
+        self.session = session
+
+    @metrics.instrument_query
+    def membership_query(self, sequence):
+        session = self.session
+        session.reset()
+        outputs = []
+        alive = True
+        for cmd in sequence:
+            reply = session.handle(cmd) if alive and not session.closed else None
+            if reply is None:
+                alive = False
+                outputs.append("OFF")
+            else:
+                outputs.append(reply[:3])
+        return outputs
+
+    query = membership_query
+
+    def query_batch(self, words):
+        return [self.membership_query(w) for w in words]
+
+    def close(self):
+        pass
+
+
+class MachineTeacher:
+    """Teacher backed by a known MealyMachine, for synthetic benchmarks.
+
+    Counts the queries and symbols it is asked, which is what a live target
+    would have cost.
+    """
+
+    workers = 1
+
+    def __init__(self, machine):
+        self.machine = machine
+        self.queries = 0
+        self.symbols = 0
+
+    def membership_query(self, sequence):
+        self.queries += 1
+        self.symbols += len(sequence)
+        return self.machine.simulate(sequence)
+
+    query = membership_query
+
+    def query_batch(self, words):
+        return [self.membership_query(w) for w in words]
+
+    def close(self):
+        pass